@@ -1,8 +1,11 @@
 # Copyright (c) 2022, Arm Limited.
 # SPDX-License-Identifier: MIT
 
+import json
 import os
+import shrinkwrap.utils.cache as cache
 import shrinkwrap.utils.config as config
+import shrinkwrap.utils.fingerprint as fingerprint
 import shrinkwrap.utils.graph as ugraph
 import shrinkwrap.utils.runtime as runtime
 import shrinkwrap.utils.workspace as workspace
@@ -37,7 +40,15 @@ def add_parser(parser, formatter):
 		     if <SHRINKWRAP_CONFIG> is not defined. <SHRINKWRAP_BUILD>
 		     and <SHRINKWRAP_PACKAGE> default to '~/.shrinkwrap/build'
 		     and '~/.shrinkwrap/package'. The user can override them by
-		     setting the environment variables.""")
+		     setting the environment variables. If <SHRINKWRAP_CACHE>
+		     is set, it is used as an artifact cache, which may be shared
+		     between workspaces and machines. Components whose
+		     artifacts are found in the cache are fetched instead of
+		     built, and newly built artifacts are published to it. If
+		     <SHRINKWRAP_GITCACHE> is set, bare mirrors of all git
+		     remotes (including submodules) are maintained there and
+		     repos are cloned with objects borrowed from the
+		     mirrors.""")
 
 	cmdp.add_argument('configs',
 		metavar='config', nargs='*',
@@ -85,6 +96,61 @@ def add_parser(parser, formatter):
 		required=False, default=False, action='store_true',
 		help="""If specified, logs will not be colorized.""")
 
+	cmdp.add_argument('--clone',
+		required=False, default=None,
+		choices=['full', 'shallow', 'partial'],
+		help="""How git repos are cloned when they are first synced, for
+		     repos that don't specify a "clone" mode in their config.
+		     'full' clones the entire history. 'shallow' only fetches
+		     the required revision (and shallow submodules), falling
+		     back to a full fetch if that fails. 'partial' fetches all
+		     commits but only the file contents that are checked out.
+		     Ignored when <SHRINKWRAP_GITCACHE> is set.
+		     Defaults to 'full'.""")
+
+	cmdp.add_argument('-i', '--incremental',
+		required=False, default=False, action='store_true',
+		help="""If specified, components whose fingerprint matches the
+		     one recorded at their last successful build are not synced
+		     or rebuilt. The fingerprint covers the resolved build
+		     description (repo, toolchain, params and commands), the
+		     fingerprints of the components it imports artifacts from
+		     and the contents of the artifacts it produced. Local
+		     modifications to a component's source tree are not
+		     detected.""")
+
+	cmdp.add_argument('-J', '--jobserver',
+		required=False, default=False, action='store_true',
+		help="""If specified, all component build tasks share a single
+		     GNU make jobserver, rather than each task running up to
+		     --jobs make jobs of its own. The jobserver holds --jobs - 1
+		     tokens, and every make that is running can also always run
+		     one job without a token, so a component that builds on its
+		     own still gets --jobs jobs, but at most --jobs - 1 +
+		     --tasks make jobs run across all tasks. This avoids
+		     oversubscribing the CPUs when many components build in
+		     parallel. Explicit -j options passed to make by component
+		     build commands are dropped in favour of the jobserver.
+		     Only affects GNU make; other build systems still use
+		     --jobs per task.""")
+
+	cmdp.add_argument('--trace',
+		metavar='file', required=False, default=None,
+		help="""If specified, a timeline of the build is saved to file in
+		     Chrome trace event format, which can be opened with
+		     Perfetto (https://ui.perfetto.dev) or chrome://tracing.
+		     Each task is a track, showing the steps it executed. Each
+		     step also records how long it waited for a free task and
+		     its exit status. The file is written even if the build
+		     fails.""")
+
+	cmdp.add_argument('--report',
+		required=False, default=False, action='store_true',
+		help="""If specified, a table of the build steps that took
+		     longest, with their CPU time, peak RSS and I/O, is printed
+		     at the end of the build. The resource usage of every step
+		     is always saved to <SHRINKWRAP_PACKAGE>/build-report.json.""")
+
 	return cmd_name
 
 
@@ -95,10 +161,11 @@ def dispatch(args):
 	command line. The arguments comply with those requested in add_parser().
 	"""
 	clivars = {'jobs': args.jobs}
-	configs = config.load_resolveb_all(args.configs, args.overlay, clivars)
-	if len(args.configs) == 0:
-		configs = [c for c in configs if c['concrete']]
-	graph = config.build_graph(configs, args.verbose)
+	configs = config.load_resolveb_all(args.configs,
+					   args.overlay,
+					   clivars,
+					   concrete=True)
+	graph = config.build_graph(configs, args.verbose, args.clone)
 
 	if args.dry_run:
 		script = ugraph.make_script(graph)
@@ -120,6 +187,8 @@ def dispatch(args):
 
 			add_volume(workspace.build)
 			add_volume(workspace.package)
+			if workspace.gitcache:
+				add_volume(workspace.gitcache)
 			for c in workspace.configs():
 				add_volume(c)
 
@@ -130,12 +199,44 @@ def dispatch(args):
 
 			rt.start()
 
-			ugraph.execute(graph,
-				       args.tasks,
-				       args.verbose,
-				       not args.no_color)
+			rtid = None
+			if workspace.cache:
+				rtid = cache.runtime_id(args.runtime, args.image)
+
+			# Fingerprints and cache keys are computed from the
+			# configs resolved without the machine specific number
+			# of jobs.
+			fpconfigs = config.load_resolveb_all(
+					args.configs,
+					args.overlay,
+					fingerprint.clivars(clivars),
+					concrete=True)
+			fpconfigs = {c['name']: c for c in fpconfigs}
+
+			uptodate = set()
+			for c in fpconfigs.values():
+				names = set()
+				if args.incremental:
+					names = fingerprint.uptodate(c)
+				if workspace.cache:
+					names |= cache.fetch(c, rtid, names)
+				uptodate |= {(c['name'], n) for n in names}
+
+			stats = ugraph.execute(graph,
+					       args.tasks,
+					       args.verbose,
+					       not args.no_color,
+					       uptodate,
+					       args.jobs if args.jobserver else None,
+					       args.trace)
 
 		for c in configs:
+			# Record the fingerprints of what was built and share the
+			# artifacts through the cache.
+			fingerprint.save(fpconfigs[c['name']])
+			if workspace.cache:
+				cache.publish(fpconfigs[c['name']], rtid)
+
 			# Dump the config.
 			cfg_name = os.path.join(workspace.package,
 						f'{c["name"]}.yaml')
@@ -143,10 +244,49 @@ def dispatch(args):
 				config.dump(c, cfg)
 
 			# Dump the script to build the config.
-			graph = config.build_graph([c], args.verbose)
+			graph = config.build_graph([c], args.verbose, args.clone)
 			script = ugraph.make_script(graph)
 			build_name = os.path.join(workspace.package,
 						  c['name'],
 						  'build.sh')
 			with open(build_name, 'w') as build:
 				build.write(script)
+
+		# Report the resources used by each step of the build.
+		_report(stats, args.runtime, args.report)
+
+
+def _report(stats, rtname, table, rows=20):
+	"""
+	Writes the resource usage of every executed script fragment to a JSON
+	report in <SHRINKWRAP_PACKAGE>. If table is True, also prints a summary
+	table of the ones that took longest.
+	"""
+	report = os.path.join(workspace.package, 'build-report.json')
+	with open(report, 'w') as file:
+		json.dump({'runtime': rtname, 'fragments': stats}, file, indent=4)
+
+	if not table or len(stats) == 0:
+		return
+
+	def _fmt(value, scale=1, fmt='.1f'):
+		return '-' if value is None else format(value / scale, fmt)
+
+	mb = 1024 * 1024
+	print()
+	print(f'{"step":<48} {"wall(s)":>7} {"user(s)":>7} {"sys(s)":>7} '
+	      f'{"rss(MB)":>7} {"rd(MB)":>7} {"wr(MB)":>7}')
+	for st in sorted(stats, key=lambda st: st['wall'], reverse=True)[:rows]:
+		# Steps for all configs (removing the old package and creating
+		# the directory structure) have no config or component, and
+		# copying a config's artifacts has no component.
+		name = ':'.join(n for n in [st['config'], st['component']]
+				if n is not None)
+		step = f'{name or "-"} {st["summary"]}'
+		print(f'{step[:48]:<48} {_fmt(st["wall"]):>7} '
+		      f'{_fmt(st["user"]):>7} {_fmt(st["sys"]):>7} '
+		      f'{_fmt(st["maxrss"], mb):>7} {_fmt(st["read"], mb):>7} '
+		      f'{_fmt(st["write"], mb):>7}')
+	if len(stats) > rows:
+		print(f'({len(stats) - rows} more steps)')
+	print(f'Full report: {report}')
@@ -96,9 +96,10 @@ def dispatch(args):
 	command line. The arguments comply with those requested in add_parser().
 	"""
 	clivars = {'jobs': args.jobs}
-	configs = config.load_resolveb_all(args.configs, args.overlay, clivars)
-	if len(args.configs) == 0:
-		configs = [c for c in configs if c['concrete']]
+	configs = config.load_resolveb_all(args.configs,
+					   args.overlay,
+					   clivars,
+					   concrete=True)
 	for conf in configs:
 		conf['graph'] = _filter(conf['name'],
 					conf['graph'],
@@ -2,8 +2,10 @@
 # SPDX-License-Identifier: MIT
 
 import io
+import json
 import os
 import textwrap
+import shrinkwrap.utils.catalogue as catalogue
 import shrinkwrap.utils.config as config
 
 
@@ -42,6 +44,14 @@ def add_parser(parser, formatter):
 		     lists all standard configs rather than just the concrete
 		     ones.""")
 
+	cmdp.add_argument('-f', '--format',
+		required=False, default='text', choices=['text', 'json'],
+		help="""Output format. 'text' is wrapped for reading by humans.
+		     'json' is a list of objects, one per config, each with
+		     "name", "description", "concrete" and "rtvars" (mapping
+		     each run-time variable to its default value) members.
+		     Defaults to 'text'.""")
+
 	return cmd_name
 
 
@@ -51,17 +61,40 @@ def dispatch(args):
 	execute the subcommand, with the arguments the user passed on the
 	command line. The arguments comply with those requested in add_parser().
 	"""
-	configs = config.load_resolveb_all(args.configs)
+	if len(args.configs) == 0:
+		# Everything needed to list the standard configs is in the
+		# catalogue, so there's no need to load them.
+		configs = [e for e in catalogue.entries()
+				if e['resolves'] and (args.all or e['concrete'])]
+	else:
+		# None of the fields that are output depend on the build-time
+		# macros, so the configs only need to be loaded, not resolved.
+		configs = []
+		for name in args.configs:
+			c = config.load(config.filename(name), None, name)
+			c['rtvars'] = {k: v['value']
+				for k, v in c['run']['rtvars'].items()}
+			configs.append(c)
+
+	configs = sorted(configs, key=lambda c: c['fullname'])
+
+	if args.format == 'json':
+		# Values that JSON can't represent (e.g. rtvar defaults that
+		# YAML parses as dates) are output as strings, as for 'text'.
+		print(json.dumps([{
+			'name': c['fullname'],
+			'description': c['description'],
+			'concrete': c['concrete'],
+			'rtvars': c['rtvars'],
+		} for c in configs], indent=4, default=str))
+		return
 
 	width = 80
 	indent = 21
 	vindent = 24
 
 	descs = []
-	for c in sorted(configs, key=lambda c: c['fullname']):
-		if len(args.configs) == 0 and not args.all and not c['concrete']:
-			continue
-
+	for c in configs:
 		buf = io.StringIO()
 
 		buf.write(_text_wrap('name',
@@ -82,9 +115,8 @@ def dispatch(args):
 				     indent=indent,
 				     paraspace=1))
 		buf.write('\n')
-		rtvars = {k: v['value'] for k,v in c['run']['rtvars'].items()}
 		buf.write(_dict_wrap('run-time variables',
-				     rtvars,
+				     c['rtvars'],
 				     width=width,
 				     kindent=indent,
 				     vindent=vindent))
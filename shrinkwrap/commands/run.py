@@ -111,7 +111,7 @@ def dispatch(args):
 		match = "Escape character is '^]'."
 		pdata = proc.data
 
-		for line in logger.splitlines(data):
+		for line in _splitlines(data):
 			if len(pdata) >= 2 and terminals[pdata[1]]['strip']:
 				if line.find(match) >= 0:
 					terminals[pdata[1]]['strip'] = False
@@ -151,6 +151,12 @@ def dispatch(args):
 		if found_all_ports:
 			wait = False
 			strip = False
+			ip = runtime.get().ip_address
+
+			print()
+			print(f"Environment ip address: {ip}.")
+			print()
+
 			for k, t in terminals.items():
 				name = t['friendly']
 				type = t['type']
@@ -176,17 +182,29 @@ def dispatch(args):
 					pass
 				if type in ['telnet']:
 					wait = True
-					ip = runtime.get().ip_address()
 					print(f'To start {name} terminal, run:')
 					print(f'    telnet {ip} {port}')
+			handler = _strip_telnet_header if strip else log.log
+
 			if wait:
+				# Hold the output while the user reads the
+				# instructions, without blocking the loop.
+				held = []
+				pm.set_handler(lambda *args: held.append(args))
 				print()
-				input("Press Enter to continue...")
+				return _wait_for_user(pm, handler, held)
 
-			if strip:
-				pm.set_handler(_strip_telnet_header)
-			else:
-				pm.set_handler(log.log)
+			pm.set_handler(handler)
+
+	async def _wait_for_user(pm, handler, held):
+		"""
+		Waits for the user to press Enter, then switches to handler and
+		passes it the output that was held in the meantime.
+		"""
+		await pm.prompt('Press Enter to continue...')
+		pm.set_handler(handler)
+		for args in held:
+			handler(*args)
 
 	def _complete(pm, proc, retcode):
 		# If the FVP exits with non-zero exit code, we propagate that
@@ -204,6 +222,11 @@ def dispatch(args):
 		rt.add_volume(workspace.package)
 		rt.start()
 
+		# The ip address is only needed once the fvp has booted far
+		# enough to report its terminal ports, so look it up while the
+		# fvp is starting.
+		rt.lookup_ip_address()
+
 		# Write the script out to a file in a temp directory, and wrap
 		# the directory name and command to run in a Process. Add the
 		# Process to the ProcessManager. On completion, the caller must
@@ -219,23 +242,32 @@ def dispatch(args):
 			# have terminated. The fvp will terminate when its told
 			# to `poweroff` and netcat will terminate when it sees
 			# the fvp has gone.
-			pm = process.ProcessManager(_find_term_ports, _complete)
+			pm = process.AsyncProcessManager(_find_term_ports,
+							 _complete)
 			pm.add(process.Process(f'bash {tmpfilename}',
 					False,
 					(log.alloc_data('fvp'),),
 					True))
 
-			rt_ip = runtime.get().ip_address()
-
 			print()
 			print("Press '^]' to quit shrinkwrap.")
 			print("All other keys are passed through.")
-			print(f"Environment ip address: {rt_ip}.")
 			print()
 
 			pm.run(forward_stdin=True)
 
 
+def _splitlines(string):
+	"""
+	Like str.splitlines(True) but preserves '\r'.
+	"""
+	lines = string.split('\n')
+	keepends = [l + '\n' for l in lines[:-1]]
+	if lines[-1] != '':
+		keepends.append(lines[-1])
+	return keepends
+
+
 def _pretty_print_sh(run):
 	prerun = run['prerun']
 	run = run['run']
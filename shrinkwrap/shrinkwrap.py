@@ -12,15 +12,15 @@ sys.path = [root] + sys.path
 
 
 import argparse
+import importlib
 import shutil
 from shrinkwrap import __version__
 
 
-from shrinkwrap.commands import build
-from shrinkwrap.commands import clean
-from shrinkwrap.commands import inspect
-from shrinkwrap.commands import process
-from shrinkwrap.commands import run
+# All supported commands. Each is implemented by the module of the same name
+# in shrinkwrap.commands. The modules are only imported when needed, since
+# some of them have expensive dependencies.
+COMMANDS = ['build', 'clean', 'inspect', 'process', 'run']
 
 
 VERBOSE = True
@@ -36,6 +36,32 @@ def config_verbose_flag(args):
 		VERBOSE = False
 
 
+def find_command(argv):
+	"""
+	Returns the name of the command that the user requested, or None if the
+	command is missing or unknown. The command is the first argument that
+	isn't a global option or the value of one.
+	"""
+	takes_value = ['-R', '--runtime', '-I', '--image']
+	i = 0
+
+	while i < len(argv):
+		arg = argv[i]
+		if arg.startswith('--') and '=' not in arg and \
+		   any(o.startswith(arg) for o in takes_value if len(arg) > 2):
+			# Long option, possibly abbreviated, with its value in
+			# the next argument.
+			i += 2
+		elif arg in takes_value:
+			i += 2
+		elif arg.startswith('-'):
+			i += 1
+		else:
+			return arg if arg in COMMANDS else None
+
+	return None
+
+
 def formatter(prog):
 	width = shutil.get_terminal_size().columns
 	width -= 2
@@ -88,13 +114,14 @@ def main():
 						 f'"{tool_name} <command> '
 						 f'--help" for more info)')
 
-	# Register all the commands.
+	# Register the commands. If the user requested a known command, only
+	# that one needs to be imported and registered. Otherwise, register
+	# them all so that the help and error messages are complete.
+	command = find_command(sys.argv[1:])
 	cmds = {}
-	cmds[build.add_parser(subparsers, formatter)] = build
-	cmds[clean.add_parser(subparsers, formatter)] = clean
-	cmds[inspect.add_parser(subparsers, formatter)] = inspect
-	cmds[process.add_parser(subparsers, formatter)] = process
-	cmds[run.add_parser(subparsers, formatter)] = run
+	for name in [command] if command else COMMANDS:
+		module = importlib.import_module(f'shrinkwrap.commands.{name}')
+		cmds[module.add_parser(subparsers, formatter)] = module
 
 	# Parse the arguments.
 	args = parser.parse_args()
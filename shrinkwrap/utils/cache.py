@@ -0,0 +1,238 @@
+# Copyright (c) 2022, Arm Limited.
+# SPDX-License-Identifier: MIT
+
+import graphlib
+import hashlib
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import shrinkwrap.utils.config as uconfig
+import shrinkwrap.utils.fingerprint as fingerprint
+import shrinkwrap.utils.workspace as workspace
+
+
+def _entry(key):
+	"""
+	Returns the cache directory that holds the artifacts for the component
+	with the given key.
+	"""
+	return os.path.join(workspace.cache, key[:2], key)
+
+
+def _cacheable(config, name):
+	"""
+	Returns True if the component's artifacts can be shared through the
+	cache. The component must be built by shrinkwrap in its own source and
+	build directories, and all of its artifacts must live in one of them, so
+	that fetching from the cache never writes outside of the workspace.
+	"""
+	component = config['build'][name]
+	sourcedir, builddir = uconfig.default_dirs(config, name)
+
+	if component['sourcedir'] != sourcedir or \
+	   component['builddir'] != builddir:
+		return False
+
+	if len(component['artifacts']) == 0 or \
+	   len(component['prebuild']) + \
+	   len(component['build']) + \
+	   len(component['postbuild']) == 0:
+		return False
+
+	for src in component['artifacts'].values():
+		if os.path.commonpath([src, sourcedir]) != sourcedir and \
+		   os.path.commonpath([src, builddir]) != builddir:
+			return False
+
+	return True
+
+
+def _git(*args):
+	"""
+	Runs git on the host and returns its stdout, or None if it fails.
+	"""
+	try:
+		res = subprocess.run(['git', *args],
+				     universal_newlines=True,
+				     stdout=subprocess.PIPE,
+				     stderr=subprocess.DEVNULL)
+	except OSError:
+		return None
+	return res.stdout if res.returncode == 0 else None
+
+
+def _ls_remote(remote, revision):
+	"""
+	Returns the commit sha that revision (a full sha, branch, tag or ref)
+	currently refers to in the remote, or None if it can't be determined.
+	"""
+	if revision is None:
+		revision = 'HEAD'
+	if re.fullmatch(r'[0-9a-f]{40}', revision):
+		return revision
+
+	out = _git('ls-remote', remote, revision)
+	if out is None:
+		return None
+	lines = [l.split('\t') for l in out.splitlines()]
+	refs = {ref: sha for sha, ref in lines}
+
+	# Prefer what `git checkout` would pick; a branch, then a tag (the
+	# commit an annotated tag points to, rather than the tag object).
+	for ref in [f'refs/heads/{revision}',
+		    f'refs/tags/{revision}^{{}}',
+		    f'refs/tags/{revision}',
+		    revision]:
+		if ref in refs:
+			return refs[ref]
+	return None
+
+
+def _revision(component, gitlocal, repo):
+	"""
+	Returns the commit sha that the component's repo will be built from, or
+	None if it can't be determined. An existing checkout is not synced
+	again, so it is built from whatever is checked out, and it must not
+	have any local changes. Otherwise the repo will be cloned at the
+	revision that the remote currently has.
+	"""
+	path = os.path.normpath(os.path.join(component['sourcedir'], gitlocal))
+	sync = os.path.join(os.path.dirname(path),
+			    f'.{os.path.basename(path)}_sync')
+
+	if os.path.isdir(os.path.join(path, '.git')) and \
+	   not os.path.exists(sync):
+		status = _git('-C', path, 'status', '--porcelain',
+			      '--untracked-files=no')
+		if status is None or status != '':
+			return None
+		head = _git('-C', path, 'rev-parse', 'HEAD')
+		return head.strip() if head else None
+
+	return _ls_remote(repo['remote'], repo['revision'])
+
+
+def runtime_id(rtname, image):
+	"""
+	Returns a string that identifies the environment that components are
+	built in, which is part of the cache key, or None if it can't be
+	determined. For container runtimes, this is the id of the image, so
+	that a new image behind the same name gets new cache entries.
+	"""
+	if rtname == 'null':
+		return rtname
+
+	engine = rtname.split('-')[0]
+	try:
+		res = subprocess.run([engine, 'image', 'inspect',
+				      '--format', '{{.Id}}', image],
+				     universal_newlines=True,
+				     stdout=subprocess.PIPE,
+				     stderr=subprocess.DEVNULL)
+	except OSError:
+		return None
+	if res.returncode != 0:
+		return None
+	return f'{rtname}:{res.stdout.strip()}'
+
+
+def _keys(config, rtid):
+	"""
+	Returns the cache keys, keyed by component name, of the config's
+	components that can be shared through the cache. A key covers the
+	component's relocatable fingerprint with each repo revision resolved
+	to the exact commit built (so a branch that moves on gets new keys),
+	and the runtime environment rtid. Components whose commits can't be
+	determined, or that import from one that can't, are left out. The
+	config must be resolved with fingerprint.clivars(), so that machines
+	with different numbers of jobs share entries.
+	"""
+	if rtid is None:
+		return {}
+
+	build = {}
+	resolved = set()
+	for name, component in config['build'].items():
+		repos = {}
+		for gitlocal, repo in component['repo'].items():
+			sha = _revision(component, gitlocal, repo)
+			if sha is None:
+				break
+			repos[gitlocal] = {**repo, 'revision': sha}
+		else:
+			resolved.add(name)
+			component = {**component, 'repo': repos}
+		build[name] = component
+
+	keys = fingerprint.components({**config, 'build': build},
+				      artifacts=False,
+				      relocatable=True)
+
+	result = {}
+	for name in graphlib.TopologicalSorter(config['graph']).static_order():
+		if name in resolved and \
+		   _cacheable(config, name) and \
+		   all(d in result for d in config['graph'][name]):
+			digest = hashlib.sha256(f'{keys[name]}:{rtid}'.encode())
+			result[name] = digest.hexdigest()
+	return result
+
+
+def fetch(config, rtid, exclude=set()):
+	"""
+	Copies the artifacts of each cacheable component of the config that is
+	present in the cache to the location where the component's build would
+	have put them. rtid identifies the runtime, as returned by runtime_id().
+	Components named in exclude are not considered. Returns the set of
+	component names that were fetched, which do not need to be built.
+	"""
+	fetched = set()
+
+	for name, key in _keys(config, rtid).items():
+		if name in exclude:
+			continue
+
+		entry = _entry(key)
+		artifacts = config['build'][name]['artifacts']
+		if not all(os.path.isfile(os.path.join(entry, a))
+							for a in artifacts):
+			continue
+
+		for a, src in artifacts.items():
+			os.makedirs(os.path.dirname(src), exist_ok=True)
+			shutil.copyfile(os.path.join(entry, a), src)
+		fetched.add(name)
+
+	return fetched
+
+
+def publish(config, rtid):
+	"""
+	Copies the artifacts of each cacheable component of the config into the
+	cache, unless they are already present. rtid identifies the runtime, as
+	returned by runtime_id(). Should only be called once the config has been
+	successfully built. Entries are populated in a private directory and
+	then renamed into place, so concurrent builds sharing the cache never
+	observe a partial entry.
+	"""
+	for name, key in _keys(config, rtid).items():
+		entry = _entry(key)
+		if os.path.exists(entry):
+			continue
+
+		os.makedirs(os.path.dirname(entry), exist_ok=True)
+		tmpdir = tempfile.mkdtemp(dir=os.path.dirname(entry))
+		try:
+			artifacts = config['build'][name]['artifacts']
+			for a, src in artifacts.items():
+				shutil.copyfile(src, os.path.join(tmpdir, a))
+			# mkdtemp() creates the directory private to the user,
+			# but the cache may be shared with others.
+			os.chmod(tmpdir, 0o755)
+			os.rename(tmpdir, entry)
+		except OSError:
+			# Most likely another build published the same entry
+			# first. Either way, the cache is only an optimization.
+			shutil.rmtree(tmpdir, ignore_errors=True)
@@ -0,0 +1,179 @@
+# Copyright (c) 2022, Arm Limited.
+# SPDX-License-Identifier: MIT
+
+import hashlib
+import json
+import os
+import tempfile
+import shrinkwrap.utils.config as config
+import shrinkwrap.utils.workspace as workspace
+
+
+def _mtime(path):
+	try:
+		return os.stat(path).st_mtime_ns
+	except OSError:
+		return None
+
+
+# The indexes loaded or saved by this process, keyed by store, so that they
+# are only read from disk once per invocation (and are kept even if there is
+# nowhere to save them).
+_indexes = {}
+
+
+def _filename(store):
+	"""
+	Returns the location of the index for the given config store, or None
+	if indexes are not saved.
+	"""
+	cachedir = config.cfgcache_dir()
+	if not cachedir:
+		return None
+	digest = hashlib.sha256(store.encode()).hexdigest()
+	return os.path.join(cachedir, 'catalogue', f'{digest}.json')
+
+
+def _header():
+	"""
+	Returns the properties, other than the config files themselves, that the
+	entries of an index depend on. An index whose header doesn't match is
+	discarded. Layers are searched for across all the stores, so the whole
+	list of stores matters, and the code that loads the configs matters
+	too.
+	"""
+	return {
+		'stores': workspace.configs(),
+		'code': _mtime(config.__file__),
+	}
+
+
+def _load_index(store):
+	if store in _indexes:
+		return _indexes[store]
+	filename = _filename(store)
+	if not filename:
+		return {}
+	try:
+		with open(filename) as file:
+			index = json.load(file)
+		if index['header'] == _header():
+			_indexes[store] = index['entries']
+			return index['entries']
+	except (OSError, ValueError, KeyError):
+		pass
+	return {}
+
+
+def _save_index(store, entries):
+	# Values that JSON can't represent (e.g. rtvar defaults that YAML parses
+	# as dates) are stored as strings, which is how they are printed anyway.
+	_indexes[store] = entries
+	filename = _filename(store)
+	if not filename:
+		return
+	tmp = None
+	try:
+		os.makedirs(os.path.dirname(filename), exist_ok=True)
+		fd, tmp = tempfile.mkstemp(dir=os.path.dirname(filename))
+		with os.fdopen(fd, 'w') as file:
+			json.dump({'header': _header(), 'entries': entries},
+				  file,
+				  default=str)
+		os.replace(tmp, filename)
+		tmp = None
+	except Exception:
+		# The index is only an optimization.
+		pass
+	finally:
+		if tmp:
+			try:
+				os.unlink(tmp)
+			except OSError:
+				pass
+
+
+def _uptodate(entry, file):
+	return entry['file'] == file and \
+		all(_mtime(p) == m for p, m in entry['deps'].items())
+
+
+def _mk_entry(name, file):
+	"""
+	Loads and resolves the named config, the same way that
+	config.load_resolveb_all() does, and returns its index entry. The entry
+	records whether the config loads and resolves, along with the properties
+	needed to list it, and the modification times of all the files that
+	were read so that it can be revalidated without parsing any YAML.
+	"""
+	files = config.layer_files(file)
+	entry = {
+		'name': name,
+		'file': file,
+		'deps': {p: _mtime(p) for p in files},
+		'loads': False,
+		'resolves': False,
+		'fullname': name,
+		'description': None,
+		'concrete': False,
+		'layers': [],
+		'rtvars': {},
+	}
+
+	try:
+		merged = config.load(file, None, name)
+		entry['loads'] = True
+		entry['description'] = merged['description']
+		entry['concrete'] = merged['concrete']
+		entry['layers'] = files[1:]
+		entry['rtvars'] = {k: v['value']
+				for k, v in merged['run']['rtvars'].items()}
+		config.resolveb(merged)
+		entry['resolves'] = True
+	except Exception:
+		pass
+
+	return entry
+
+
+def entries():
+	"""
+	Returns the catalogue entries for every file in every config store, in
+	the order they are found. Each entry is a dictionary holding the
+	config's 'name' (relative to its store), 'fullname', 'description',
+	'concrete', 'layers' (the paths of all its layers, recursively) and
+	'rtvars' (their default values), as well as whether the config 'loads'
+	and 'resolves' without error. Each store has an index, which is
+	revalidated against file modification times, so only configs that
+	changed (or any of whose layers changed) since the last call are
+	parsed. Indexes are kept for the life of the process, and saved under
+	<SHRINKWRAP_CFGCACHE> if it is set.
+	"""
+	result = []
+
+	for store in workspace.configs():
+		prev = _load_index(store)
+		curr = {}
+		for root, dirs, files in os.walk(store):
+			for f in files:
+				name = os.path.relpath(os.path.join(root, f), store)
+				file = config.filename(name)
+				entry = prev.get(name)
+				if entry is None or not _uptodate(entry, file):
+					entry = _mk_entry(name, file)
+				curr[name] = entry
+				result.append(entry)
+
+		if curr != prev:
+			_save_index(store, curr)
+
+	return result
+
+
+def names(concrete=False):
+	"""
+	Returns the names of all the configs in the config stores that can be
+	loaded. If concrete is True, only the concrete configs are returned.
+	"""
+	return [e['name'] for e in entries()
+			if e['loads'] and (e['concrete'] or not concrete)]
@@ -1,13 +1,22 @@
 # Copyright (c) 2022, Arm Limited.
 # SPDX-License-Identifier: MIT
 
+import collections
+import copy
+import functools
 import graphlib
+import hashlib
 import io
 import os
+import pickle
 import re
-import yaml
+import sys
+import tempfile
+import shrinkwrap.utils.catalogue as catalogue
 import shrinkwrap.utils.clivars as uclivars
+import shrinkwrap.utils.fingerprint as fingerprint
 import shrinkwrap.utils.workspace as workspace
+import shrinkwrap.utils.yamlio as yamlio
 
 
 def _component_normalize(component, name):
@@ -183,96 +192,123 @@ def _config_sort(config):
 	return dict(sorted(config.items(), key=lambda x: lut[x[0]]))
 
 
-def _config_merge(base, new):
+def _merge(values):
 	"""
-	Merges new config into the base config.
+	Merges a list of values, in order, each taking priority over those
+	before it. None values are ignored. A list is appended to a preceding
+	list and a dict is merged key-by-key into a preceding dict. Any other
+	value (or a value whose type differs from the preceding one) replaces
+	whatever came before. This is equivalent to folding pairwise merges
+	over the values, but each key is visited once and each list is copied
+	once, however many values there are. Lists and dicts of merged values
+	are new objects, but a value that isn't merged with anything is
+	returned as is.
+	"""
+	values = [v for v in values if v is not None]
+	if len(values) == 0:
+		return None
+
+	# Only the trailing run of values of the same container type as the
+	# last value contributes to the result.
+	kind = type(values[-1])
+	if kind is not list and kind is not dict:
+		return values[-1]
+
+	start = len(values) - 1
+	while start > 0 and type(values[start - 1]) is kind:
+		start -= 1
+	values = values[start:]
+
+	if len(values) == 1:
+		return values[0]
+
+	if kind is list:
+		merged = []
+		for v in values:
+			merged.extend(v)
+		return merged
+
+	keys = {}
+	for v in values:
+		for k in v:
+			keys.setdefault(k, []).append(v[k])
+	return {k: _merge(vs) for k, vs in keys.items()}
+
+
+def _config_merge_all(configs):
+	"""
+	Merges a list of configs, in order, each taking priority over those
+	before it.
 	"""
-	_config_validate(base)
-	_config_validate(new)
+	for config in configs:
+		_config_validate(config)
 
-	def _merge(base, new, level=0):
-		if new is None:
-			return base
+	config = _merge(configs)
 
-		if type(base) is list and type(new) is list:
-			return base + new
+	# We add a dummy component if there are no others. After merging, if
+	# there other components, remove it.
+	if '__dummy' in config['build'] and len(config['build']) > 1:
+		config['build'] = {k: v for k, v in config['build'].items()
+							if k != '__dummy'}
 
-		if type(base) is dict and type(new) is dict:
-			d = {}
-			for k in list(base.keys()) + list(new.keys()):
-				d[k] = _merge(base.get(k), new.get(k), level+1)
-			return d
+	return config
 
-		if type(base) is str and type(new) is str:
-			return new
 
-		return new
+def _config_merge(base, new):
+	"""
+	Merges new config into the base config.
+	"""
+	return _config_merge_all([base, new])
 
-	config = _merge(base, new)
 
-	# We add a dummy component if there are no others. After merging, if
-	# there other components, remove it.
-	if '__dummy' in config['build'] and len(config['build']) > 1:
-		del config['build']['__dummy']
+_macro_pattern = re.compile(
+	'\\$(?:'
+		'(?P<escape>\\$)|'
+		'(?:\\{'
+			'(?P<type>[_a-zA-Z][_a-zA-Z0-9]*):'
+			'(?P<name>[_a-zA-Z][_a-zA-Z0-9]*)?'
+		'\\})|'
+		'(?P<invalid>)'
+	')')
 
-	return config
+_Token = collections.namedtuple('_Token', ['type', 'value'])
+_Macro = collections.namedtuple('_Macro', ['type', 'name'])
 
 
+@functools.lru_cache(maxsize=4096)
 def _string_tokenize(string):
 	"""
-	Returns ordered list of tokens, where each token has a 'type' and
+	Returns ordered tuple of tokens, where each token has a 'type' and
 	'value'. If 'type' is 'literal', 'value' is the literal string. If
-	'type' is 'macro', 'value' is a dict defining 'type' and 'name'.
-	"""
-	regex = '\$(?:' \
-			'(?P<escape>\$)|' \
-			'(?:\{' \
-				'(?P<type>[_a-zA-Z][_a-zA-Z0-9]*):' \
-				'(?P<name>[_a-zA-Z][_a-zA-Z0-9]*)?' \
-			'\})|' \
-			'(?P<invalid>)' \
-		')'
-	pattern = re.compile(regex)
+	'type' is 'macro', 'value' has a 'type' and 'name'. The same strings
+	are tokenized many times when resolving configs that share layers, so
+	results are cached; the tokens are immutable so can be shared.
+	"""
 	tokens = []
 	lit_start = 0
 
-	m = pattern.search(string)
+	m = _macro_pattern.search(string)
 	while m:
-		lit_end = m.span()[0]
+		lit_end = m.start()
 
 		if lit_end > lit_start:
-			tokens.append({
-				'type': 'literal',
-				'value': string[lit_start:lit_end],
-			})
+			tokens.append(_Token('literal', string[lit_start:lit_end]))
 
-		lit_start = m.span()[1]
+		lit_start = m.end()
 
 		if m['invalid'] is not None:
 			raise Exception(f"Macro at col {lit_end}" \
 					f" in '{string}' is invalid.")
 		if m['escape'] is not None:
-			tokens.append({
-				'type': 'literal',
-				'value': m['escape'],
-			})
+			tokens.append(_Token('literal', m['escape']))
 		if m['type'] is not None:
-			tokens.append({
-				'type': 'macro',
-				'value': {
-					'type': m['type'],
-					'name': m['name'],
-				},
-			})
+			tokens.append(_Token('macro', _Macro(m['type'], m['name'])))
 
-		m = pattern.search(string, pos=lit_start)
+		m = _macro_pattern.search(string, pos=lit_start)
 
-	tokens.append({
-		'type': 'literal',
-		'value': string[lit_start:],
-	})
+	tokens.append(_Token('literal', string[lit_start:]))
 
-	return tokens
+	return tuple(tokens)
 
 
 def _string_substitute(string, lut, partial=False):
@@ -283,18 +319,22 @@ def _string_substitute(string, lut, partial=False):
 	the returned string. If partial is False, any macro that does not have a
 	value in the lut will cause an interrupt.
 	"""
+	# Fast path; most strings don't contain any macros.
+	if '$' not in string:
+		return string
+
 	calls = []
 	frags = []
 	frag = ''
 	tokens = _string_tokenize(string)
 
 	for t in tokens:
-		if t['type'] == 'literal':
-			frag += t['value']
-		elif t['type'] == 'macro':
-			m = t['value']
+		if t.type == 'literal':
+			frag += t.value
+		elif t.type == 'macro':
+			m = t.value
 			try:
-				lu = lut[m['type']][m['name']]
+				lu = lut[m.type][m.name]
 				if callable(lu):
 					calls.append(lu)
 					frags.append(frag)
@@ -303,7 +343,7 @@ def _string_substitute(string, lut, partial=False):
 					frag += lu
 			except KeyError:
 				if partial:
-					frag += f"${{{m['type']}:{m['name']}}}"
+					frag += f"${{{m.type}:{m.name}}}"
 				else:
 					raise
 
@@ -331,6 +371,17 @@ def _mk_params(params, separator):
 	return ' '.join(pairs)
 
 
+def default_dirs(config, name):
+	"""
+	Returns the (sourcedir, builddir) tuple that shrinkwrap allocates for the
+	named component of the config when the config does not specify its own
+	locations.
+	"""
+	comp_dir = os.path.join(config['name'], name)
+	return (os.path.join(workspace.build, 'source', comp_dir),
+		os.path.join(workspace.build, 'build', comp_dir))
+
+
 def filename(name, rel=os.getcwd()):
 	"""
 	Given a config name, finds the path to the config on disk. If the config
@@ -350,30 +401,216 @@ def filename(name, rel=os.getcwd()):
 		return fpath
 
 
-def load(file_name, overlay=None, friendly=None):
+_layers = {}
+_code_key = (os.stat(__file__).st_mtime_ns, os.stat(__file__).st_size)
+
+
+def _layer_parse(file_name):
 	"""
-	Load a config from disk and return it as a dictionary. The config is
-	fully normalized, validated and merged.
+	Parses a single config file, without its layers, and returns it
+	normalized and validated.
 	"""
-	def _config_load(file_name):
-		with open(file_name) as file:
-			config = yaml.safe_load(file)
-		config_dir = os.path.dirname(file_name)
+	with open(file_name) as file:
+		config = yamlio.load(file)
 
-		config = _config_normalize(config)
-		_config_validate(config)
+	config = _config_normalize(config)
+	_config_validate(config)
+
+	return config
+
+
+@functools.lru_cache(maxsize=None)
+def cfgcache_dir():
+	"""
+	Returns <SHRINKWRAP_CFGCACHE>, creating it private to the user if it
+	doesn't exist, or None if the on-disk cache is disabled. It holds the
+	parsed layers and the catalogue's indexes. Layers are unpickled, which
+	can run arbitrary code, so the directory is only used if it is owned by
+	the user and can't be written by anyone else. Otherwise a warning is
+	printed and the cache is disabled.
+	"""
+	path = workspace.cfgcache
+	if not path:
+		return None
+	try:
+		os.makedirs(path, mode=0o700, exist_ok=True)
+		st = os.stat(path)
+	except OSError:
+		return None
+	if st.st_uid != os.getuid() or st.st_mode & 0o022:
+		print(f"Warning: Not using SHRINKWRAP_CFGCACHE '{path}', " \
+		      f"since it is not owned by the user or is writable by " \
+		      f"group or others.",
+		      file=sys.stderr)
+		return None
+	return path
+
+
+def _layer_cache_entry(key):
+	"""
+	Returns the file in <SHRINKWRAP_CFGCACHE> that holds the parsed layer
+	for the given key, or None if the on-disk cache is disabled.
+	"""
+	cachedir = cfgcache_dir()
+	if not cachedir:
+		return None
+	digest = hashlib.sha256(key[0].encode()).hexdigest()
+	return os.path.join(cachedir, f'{digest}.pickle')
+
+
+def _layer_cache_get(key):
+	"""
+	Returns the parsed layer for the given key from the on-disk cache, or
+	None if it is not present or stale.
+	"""
+	entry = _layer_cache_entry(key)
+	if not entry:
+		return None
+	try:
+		with open(entry, 'rb') as file:
+			ekey, layer = pickle.load(file)
+	except Exception:
+		return None
+	return layer if ekey == key else None
+
+
+def _layer_cache_put(key, layer):
+	"""
+	Writes the parsed layer for the given key to the on-disk cache, if
+	enabled. The entry is written to a temp file and renamed into place, so
+	concurrent shrinkwrap invocations never see a partial entry.
+	"""
+	entry = _layer_cache_entry(key)
+	if not entry:
+		return
+	try:
+		fd, tmp = tempfile.mkstemp(dir=os.path.dirname(entry))
+		with os.fdopen(fd, 'wb') as file:
+			pickle.dump((key, layer), file)
+		os.replace(tmp, entry)
+	except OSError:
+		# The cache is only an optimization.
+		pass
+
+
+def _layer_get(file_name):
+	"""
+	Returns the parsed, normalized and validated config file, without its
+	layers. Parsed files are memoized for the life of the process, and in
+	<SHRINKWRAP_CFGCACHE> if it is set, keyed by real path, modification
+	time and size, so that layers shared by many configs are only parsed
+	once. The key also covers this module, so that cached layers are
+	discarded whenever normalization may have changed. Returns a tuple of
+	the key and the layer. The layer is shared and must not be modified.
+	"""
+	st = os.stat(file_name)
+	key = (os.path.realpath(file_name), st.st_mtime_ns, st.st_size,
+	       _code_key)
+
+	layer = _layers.get(key)
+	if layer is None:
+		layer = _layer_cache_get(key)
+		if layer is None:
+			layer = _layer_parse(file_name)
+			_layer_cache_put(key, layer)
+		_layers[key] = layer
+
+	return key, layer
+
+
+def _layers_prime(file_name, visited):
+	"""
+	Parses the config file and, recursively, all of its layers into the
+	memo, skipping files already in visited and adding the others to it, in
+	the order they are found. Errors are ignored; they will be reported when
+	the config is loaded for real.
+	"""
+	if file_name in visited:
+		return
+	visited[file_name] = None
+
+	try:
+		key, layer = _layer_get(file_name)
+	except Exception:
+		return
 
-		# Recursively load and merge the layers.
-		master = _config_normalize({})
-		for layer in config['layers']:
-			layer = _config_load(filename(layer, config_dir))
-			master = _config_merge(master, layer)
+	config_dir = os.path.dirname(file_name)
+	for name in layer['layers']:
+		_layers_prime(filename(name, config_dir), visited)
 
-		master = _config_merge(master, config)
 
-		return master
+def layer_files(file_name):
+	"""
+	Returns the list of files that load() reads for the config at file_name;
+	the config itself followed by all of its layers, recursively. Files that
+	can't be parsed are included but not followed.
+	"""
+	visited = {}
+	_layers_prime(file_name, visited)
+	return list(visited)
+
+
+def _layers_init(layers):
+	"""
+	Process pool initializer that seeds a worker's memo with the layers
+	parsed by the parent.
+	"""
+	_layers.update(layers)
+
+
+_merged = {}
+
+
+def _config_layers(file_name, layers):
+	"""
+	Appends the config file's layers, recursively, to layers in the order
+	that they are merged (each file's own layers before the file itself),
+	followed by the config file. Returns the key of the whole layer tree,
+	which covers the versions of all the files in it.
+	"""
+	key, config = _layer_get(file_name)
+	config_dir = os.path.dirname(file_name)
+
+	children = tuple(_config_layers(filename(layer, config_dir), layers)
+						for layer in config['layers'])
+	layers.append(config)
+
+	return (key, children)
 
-	config = _config_load(file_name)
+
+def _config_load(file_name):
+	"""
+	Returns the config file merged with all of its layers, recursively.
+	Merging is equivalent to folding pairwise merges, so merging each layer
+	with its own layers first and then merging the results gives the same
+	config as merging all the files of the layer tree at once, in order.
+	They are merged in a single pass, so the cost is linear in the total
+	size of the files, however deep the layers are nested. Merged results
+	are memoized, keyed by the versions of all the files in the tree.
+	_config_merge_all() never modifies its arguments, so merged configs may
+	share subtrees with each other and with the parsed layers. Returns a
+	tuple of the key and the merged config. The merged config is shared and
+	must not be modified.
+	"""
+	layers = []
+	key = _config_layers(file_name, layers)
+
+	master = _merged.get(key)
+	if master is None:
+		# Every parsed layer is normalized, so an empty config is only
+		# needed once, at the start.
+		master = _config_merge_all([_config_normalize({})] + layers)
+		_merged[key] = master
+
+	return key, master
+
+
+def load(file_name, overlay=None, friendly=None):
+	"""
+	Load a config from disk and return it as a dictionary. The config is
+	fully normalized, validated and merged.
+	"""
+	config = copy.deepcopy(_config_load(file_name)[1])
 
 	if overlay:
 		config = _config_merge(config, overlay)
@@ -394,11 +631,11 @@ def dumps(config):
 
 
 def dump(config, fileobj):
-	return yaml.safe_dump(config,
-			      fileobj,
-			      explicit_start=True,
-			      sort_keys=False,
-			      version=(1, 2))
+	return yamlio.dump(config,
+			   fileobj,
+			   explicit_start=True,
+			   sort_keys=False,
+			   version=(1, 2))
 
 
 def resolveb(config, clivars={}):
@@ -425,14 +662,14 @@ def resolveb(config, clivars={}):
 
 			for s in component['params'].values():
 				tokens = _string_tokenize(str(s))
-				macros += [t['value'] for t in tokens if t['type'] == 'macro']
+				macros += [t.value for t in tokens if t.type == 'macro']
 
 			for m in macros:
-				if m['type'] != 'artifact':
-					raise Exception(f"'{name}' uses macro of type '{m['type']}'. Components must only use 'artifact' macros.")
-				if m['name'] is None:
+				if m.type != 'artifact':
+					raise Exception(f"'{name}' uses macro of type '{m.type}'. Components must only use 'artifact' macros.")
+				if m.name is None:
 					raise Exception(f"'{name}' uses unnamed 'artifact' macro. 'artifact' macros must be named.")
-				artifacts.add(m['name'])
+				artifacts.add(m.name)
 
 			importers[name] = sorted(list(artifacts))
 
@@ -509,15 +746,11 @@ def resolveb(config, clivars={}):
 	# are already present, then don't override. This allows users to supply
 	# their own source and build tree locations.
 	for name, desc in config['build'].items():
-		comp_dir = os.path.join(config['name'], name)
+		sourcedir, builddir = default_dirs(config, name)
 		if desc['sourcedir'] is None:
-			desc['sourcedir'] = os.path.join(workspace.build,
-							 'source',
-							 comp_dir)
+			desc['sourcedir'] = sourcedir
 		if desc['builddir'] is None:
-			desc['builddir'] = os.path.join(workspace.build,
-							'build',
-							comp_dir)
+			desc['builddir'] = builddir
 
 	graph = _resolve_build_graph(config)
 	artifact_map = _resolve_artifact_map(config)
@@ -610,22 +843,20 @@ def resolver(config, rtvars={}, clivars={}):
 	return _config_sort(config)
 
 
-def load_resolveb_all(names, overlayname=None, clivars={}):
+def load_resolveb_all(names, overlayname=None, clivars={}, concrete=False):
 	"""
 	Takes a list of config names and returns a corresponding list of
 	resolved configs. If the input list is None or empty, all standard
-	configs are loaded and resolved.
+	configs are loaded and resolved (or only the concrete ones, if concrete
+	is True). The standard configs are discovered through the catalogue, so
+	files that can't be loaded or that aren't concrete are skipped without
+	being parsed.
 	"""
 	explicit = names is not None and len(names) != 0
 	configs = []
 
 	if not explicit:
-		names = []
-		for p in workspace.configs():
-			for root, dirs, files in os.walk(p):
-				names += [os.path.relpath(
-						os.path.join(root, f), p)
-								for f in files]
+		names = catalogue.names(concrete)
 
 	overlay = None
 	if overlayname:
@@ -633,19 +864,63 @@ def load_resolveb_all(names, overlayname=None, clivars={}):
 		overlay = load(overlay)
 		overlay = {'build': overlay['build'], 'run': overlay['run']}
 
-	for name in names:
-		try:
-			file = filename(name)
-			merged = load(file, overlay, name)
-			resolved = resolveb(merged, clivars)
+	# Loading and resolving each config is independent, so spread large
+	# sets of configs over a process pool. Every layer is parsed once up
+	# front and handed to the workers so that they don't each parse the
+	# shared layers again. Results are returned in the order of names
+	# either way.
+	job = functools.partial(_load_resolveb,
+				overlay=overlay,
+				clivars=clivars,
+				explicit=explicit)
+	cpus = os.cpu_count() or 1
+
+	if cpus > 1 and len(names) >= _parallel_threshold:
+		# Only import the pool when it's needed, to keep startup fast.
+		import concurrent.futures
+
+		visited = {}
+		for name in names:
+			_layers_prime(filename(name), visited)
+
+		chunksize = max(1, len(names) // (cpus * 4))
+		with concurrent.futures.ProcessPoolExecutor(
+					max_workers=cpus,
+					initializer=_layers_init,
+					initargs=(_layers,)) as pool:
+			results = list(pool.map(job, names, chunksize=chunksize))
+	else:
+		results = map(job, names)
+
+	for resolved, err in results:
+		if err:
+			raise err
+		if resolved:
 			configs.append(resolved)
-		except Exception:
-			if explicit:
-				raise
 
 	return configs
 
 
+# Minimum number of configs for which load_resolveb_all() uses a process
+# pool. Below this, the cost of starting the workers outweighs the gain.
+_parallel_threshold = 64
+
+
+def _load_resolveb(name, overlay, clivars, explicit):
+	"""
+	Loads and resolves a single config for load_resolveb_all(). Returns a
+	tuple of the resolved config (or None if it failed) and the exception
+	to raise (only ever set if explicit, since failures of configs that the
+	user didn't ask for are silently ignored).
+	"""
+	try:
+		file = filename(name)
+		merged = load(file, overlay, name)
+		return resolveb(merged, clivars), None
+	except Exception as e:
+		return None, e if explicit else None
+
+
 class Script:
 	def __init__(self,
 		     summary,
@@ -717,14 +992,187 @@ def script_preamble(echo):
 	return pre.commands(False)
 
 
-def build_graph(configs, echo):
+def _relocate(obj, relocs):
+	"""
+	Returns a copy of obj (a nested structure of dicts, lists and scalars)
+	where every occurrence of each path in relocs (a dictionary mapping old
+	paths to new ones) within its strings is replaced. Only whole paths are
+	replaced; an old path that is followed by more characters of a file
+	name (e.g. '/a/foo' within '/a/foobar') is left alone.
+	"""
+	paths = sorted(relocs.keys(), key=len, reverse=True)
+	pattern = re.compile('(' + '|'.join(map(re.escape, paths)) + ')' +
+			     r'(?![\w.+@~-])')
+
+	def _relocate_obj(obj):
+		if type(obj) is dict:
+			return {k: _relocate_obj(v) for k, v in obj.items()}
+		if type(obj) is list:
+			return [_relocate_obj(v) for v in obj]
+		if type(obj) is str:
+			return pattern.sub(lambda m: relocs[m.group(1)], obj)
+		return obj
+
+	return _relocate_obj(obj)
+
+
+def _share_components(configs):
+	"""
+	Finds components that are built identically by more than one config,
+	and redirects all but the first config that builds each one to use the
+	source and build trees of the first. Only components that live in the
+	locations allocated by shrinkwrap are considered. The configs are fixed
+	up in place. Returns a dictionary mapping each redirected (config,
+	component) pair to the (config, component) pair that owns the build.
+	"""
+	owners = {}
+	shared = {}
+
+	for config in configs:
+		keys = fingerprint.components(config,
+					      artifacts=False,
+					      relocatable=True)
+		relocs = {}
+
+		for name, key in keys.items():
+			component = config['build'][name]
+			dirs = (component['sourcedir'], component['builddir'])
+			if dirs != default_dirs(config, name):
+				continue
+
+			if key not in owners:
+				owners[key] = (config, name)
+				continue
+
+			# The component's description only differs from the
+			# owner's in its locations, so take the owner's. Its
+			# artifacts are then built in the owner's tree.
+			owner, oname = owners[key]
+			shared[(config['name'], name)] = (owner['name'], oname)
+			config['build'][name] = copy.deepcopy(owner['build'][oname])
+			for a in component['artifacts']:
+				src = owner['artifacts'][a]['src']
+				relocs[config['artifacts'][a]['src']] = src
+				config['artifacts'][a]['src'] = src
+
+		# Point the config's own components that import the shared
+		# artifacts at their new locations.
+		if len(relocs) > 0:
+			for name, component in config['build'].items():
+				if (config['name'], name) not in shared:
+					config['build'][name] = _relocate(component,
+									  relocs)
+
+	return shared
+
+
+def _gitcache_functions(script, gitargs):
+	"""
+	Appends the shell functions used to sync git repos via the git cache.
+	gitcache_mirror creates or updates the bare mirror of a remote in the
+	cache and leaves its location in GITCACHE_MIRROR. gitcache_submodules
+	recursively initializes and updates the submodules of the repo in the
+	current directory, borrowing objects from their mirrors.
+	"""
+	script.append(f'gitcache_mirror() {{')
+	script.append(f'\tGITCACHE_MIRROR="{workspace.gitcache}/$(echo "$1" | sed \'s/[^A-Za-z0-9._-]/_/g\').git"')
+	script.append(f'\tmkdir -p {workspace.gitcache}')
+	script.append(f'\texec 9> "$GITCACHE_MIRROR.lock"')
+	script.append(f'\tflock 9')
+	script.append(f'\tif [ ! -d "$GITCACHE_MIRROR" ]; then')
+	script.append(f'\t\trm -rf "$GITCACHE_MIRROR.tmp" > /dev/null 2>&1 || true')
+	script.append(f'\t\tgit clone {gitargs}--mirror "$1" "$GITCACHE_MIRROR.tmp"')
+	script.append(f'\t\tmv "$GITCACHE_MIRROR.tmp" "$GITCACHE_MIRROR"')
+	script.append(f'\telse')
+	script.append(f'\t\tgit -C "$GITCACHE_MIRROR" fetch {gitargs}--prune')
+	script.append(f'\tfi')
+	script.append(f'\texec 9>&-')
+	script.append(f'}}')
+	script.append(f'gitcache_submodules() {{')
+	script.append(f'\tlocal key url name path')
+	script.append(f'\tgit submodule {gitargs}init')
+	script.append(f'\twhile read -r -u 8 key url; do')
+	script.append(f'\t\t[ -n "$key" ] || continue')
+	script.append(f'\t\tname="${{key#submodule.}}"')
+	script.append(f'\t\tname="${{name%.url}}"')
+	script.append(f'\t\tpath="$(git config --file .gitmodules "submodule.$name.path")"')
+	script.append(f'\t\tgitcache_mirror "$url"')
+	script.append(f'\t\tgit submodule {gitargs}update --checkout --force --reference "$GITCACHE_MIRROR" --dissociate -- "$path"')
+	script.append(f'\t\tpushd "$path"')
+	script.append(f'\t\tgitcache_submodules')
+	script.append(f'\t\tpopd')
+	script.append(f'\tdone 8<<< "$(git config --get-regexp \'^submodule\\..*\\.url$\' || true)"')
+	script.append(f'}}')
+
+
+def _git_clone(script, gitargs, gitremote, gitrev, gitlocal, clone):
+	"""
+	Appends the commands to clone a repo into gitlocal, check out gitrev and
+	update its submodules. clone selects how much of the repo is fetched;
+	'full' (or None) fetches everything, 'shallow' fetches only gitrev
+	(falling back to everything if the server refuses) and 'partial'
+	fetches all commits but only the blobs that are checked out. The clone
+	mode is ignored when syncing via the git cache, since the objects are
+	already local.
+	"""
+	clone = clone or 'full'
+	if clone not in ['full', 'shallow', 'partial']:
+		raise Exception(f"Invalid clone mode '{clone}' for '{gitremote}'.")
+
+	if workspace.gitcache:
+		script.append(f'\tgitcache_mirror {gitremote}')
+		script.append(f'\tgit clone {gitargs}--reference "$GITCACHE_MIRROR" --dissociate {gitremote} {gitlocal}')
+		script.append(f'\tpushd {gitlocal}')
+		script.append(f'\tgit checkout {gitargs}--force {gitrev}')
+		script.append(f'\tgitcache_submodules')
+		script.append(f'\tpopd')
+		return
+
+	submodule = f'git submodule {gitargs}update --init --checkout --recursive --force'
+
+	if clone == 'shallow':
+		script.append(f'\tgit init {gitargs}{gitlocal}')
+		script.append(f'\tpushd {gitlocal}')
+		script.append(f'\tgit remote add origin {gitremote}')
+		script.append(f'\tif git fetch {gitargs}--depth 1 origin {gitrev}; then')
+		script.append(f'\t\tgit checkout {gitargs}--force FETCH_HEAD')
+		script.append(f'\telse')
+		script.append(f'\t\tgit fetch {gitargs}--tags origin')
+		script.append(f'\t\tgit checkout {gitargs}--force {gitrev}')
+		script.append(f'\tfi')
+		script.append(f'\tif ! {submodule} --depth 1; then')
+		script.append(f'\t\tgit submodule {gitargs}foreach --recursive "git fetch {gitargs}--unshallow || true"')
+		script.append(f'\t\t{submodule}')
+		script.append(f'\tfi')
+		script.append(f'\tpopd')
+		return
+
+	if clone == 'partial':
+		script.append(f'\tgit clone {gitargs}--filter=blob:none {gitremote} {gitlocal}')
+		submodule += ' --filter=blob:none'
+	else:
+		script.append(f'\tgit clone {gitargs}{gitremote} {gitlocal}')
+	script.append(f'\tpushd {gitlocal}')
+	script.append(f'\tgit checkout {gitargs}--force {gitrev}')
+	script.append(f'\t{submodule}')
+	script.append(f'\tpopd')
+
+
+def build_graph(configs, echo, clone=None):
 	"""
 	Returns a graph of scripts where the edges represent dependencies. The
 	scripts should be executed according to the graph in order to correctly
-	build all the configs.
+	build all the configs. Components that are built identically by several
+	of the configs are only synced and built once, and all those configs
+	take their artifacts from the shared build. Note that this modifies the
+	configs so that they refer to the shared source and build trees. clone
+	is the default clone mode for repos that don't specify their own (see
+	_git_clone()).
 	"""
 	graph = {}
 	gitargs = '' if echo else '--quiet '
+	shared = _share_components(configs)
+	owner_scripts = {}
 
 	pre = script_preamble(echo)
 
@@ -767,9 +1215,22 @@ def build_graph(configs, echo):
 			for name in ts.get_ready():
 				component = config['build'][name]
 
+				if (config['name'], name) in shared:
+					owner = shared[(config['name'], name)]
+					s = Script('Sharing build', config["name"], name, preamble=pre)
+					s.append(f'# Component shared with config={owner[0]} component={owner[1]}.')
+					s.seal()
+					graph[s] = [owner_scripts[owner]]
+
+					build_scripts[name] = s
+					ts.done(name)
+					continue
+
 				g = Script('Syncing git repo', config["name"], name, preamble=pre)
 				if len(component['repo']) > 0:
 					g.append(f'# Sync git repo for config={config["name"]} component={name}.')
+					if workspace.gitcache:
+						_gitcache_functions(g, gitargs)
 					g.append(f'pushd {os.path.dirname(component["sourcedir"])}')
 
 					for gitlocal, repo in component['repo'].items():
@@ -784,11 +1245,12 @@ def build_graph(configs, echo):
 						g.append(f'\trm -rf {gitlocal} > /dev/null 2>&1 || true')
 						g.append(f'\tmkdir -p {basedir}')
 						g.append(f'\ttouch {sync}')
-						g.append(f'\tgit clone {gitargs}{gitremote} {gitlocal}')
-						g.append(f'\tpushd {gitlocal}')
-						g.append(f'\tgit checkout {gitargs}--force {gitrev}')
-						g.append(f'\tgit submodule {gitargs}update --init --checkout --recursive --force')
-						g.append(f'\tpopd')
+						_git_clone(g,
+							   gitargs,
+							   gitremote,
+							   gitrev,
+							   gitlocal,
+							   repo.get('clone') or clone)
 						g.append(f'\trm {sync}')
 						g.append(f'fi')
 
@@ -814,6 +1276,7 @@ def build_graph(configs, echo):
 				graph[b] = [g] + [build_scripts[s] for s in config['graph'][name]]
 
 				build_scripts[name] = b
+				owner_scripts[(config['name'], name)] = b
 				ts.done(name)
 
 		a = Script('Copying artifacts', config["name"], preamble=pre, final=True)
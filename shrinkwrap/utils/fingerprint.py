@@ -0,0 +1,136 @@
+# Copyright (c) 2022, Arm Limited.
+# SPDX-License-Identifier: MIT
+
+import graphlib
+import hashlib
+import json
+import os
+import shrinkwrap.utils.workspace as workspace
+
+
+def _file_digest(path):
+	"""
+	Returns the sha256 hex digest of the file at path, or None if the file
+	can't be read (e.g. it has not been built yet).
+	"""
+	digest = hashlib.sha256()
+	try:
+		with open(path, 'rb') as file:
+			for chunk in iter(lambda: file.read(1 << 20), b''):
+				digest.update(chunk)
+	except OSError:
+		return None
+	return digest.hexdigest()
+
+
+def clivars(clivars):
+	"""
+	Returns a copy of the command line variables to resolve configs with
+	for fingerprinting. The number of jobs only affects how fast a
+	component builds, not what gets built, and its default depends on the
+	machine, so it is replaced by a fixed placeholder. Otherwise, changing
+	-j or moving to a machine with a different core count would change
+	every fingerprint.
+	"""
+	return {**clivars, 'jobs': '${param:jobs}'}
+
+
+def _component_desc(component):
+	"""
+	Returns the subset of a resolved component description that determines
+	what gets built, and where.
+	"""
+	keys = ['repo', 'sourcedir', 'builddir', 'toolchain', 'params',
+		'prebuild', 'build', 'postbuild']
+	return {k: component[k] for k in keys}
+
+
+def _relocations(config):
+	"""
+	Returns a list of (path, placeholder) pairs, longest path first, that
+	can be used to remove the workspace-specific locations from a component
+	description.
+	"""
+	relocs = [(p, '${configdir}') for p in workspace.configs()]
+	for name, component in config['build'].items():
+		relocs.append((component['sourcedir'], f'${{sourcedir:{name}}}'))
+		relocs.append((component['builddir'], f'${{builddir:{name}}}'))
+	return sorted(relocs, key=lambda r: len(r[0]), reverse=True)
+
+
+def components(config, artifacts=True, relocatable=False):
+	"""
+	Returns a dictionary of fingerprints, keyed by component name, for a
+	config previously resolved with resolveb(), using clivars() for the
+	command line variables. Each fingerprint covers the
+	component's resolved build description and the fingerprints of all the
+	components it imports artifacts from. If artifacts is True, the contents
+	of the artifact files that the component produces are also covered. If
+	relocatable is True, the source, build and config store locations are
+	replaced by placeholders so that the fingerprint is the same for any
+	config and workspace that builds the component the same way.
+	"""
+	fingerprints = {}
+	relocs = _relocations(config) if relocatable else []
+
+	ts = graphlib.TopologicalSorter(config['graph'])
+	for name in ts.static_order():
+		component = config['build'][name]
+		desc = {
+			'build': _component_desc(component),
+			'imports': {d: fingerprints[d]
+					for d in config['graph'][name]},
+			'outputs': component['artifacts'],
+		}
+		if artifacts:
+			desc['artifacts'] = {k: _file_digest(v)
+				for k, v in component['artifacts'].items()}
+
+		blob = json.dumps(desc, sort_keys=True)
+		for path, placeholder in relocs:
+			blob = blob.replace(path, placeholder)
+		blob = blob.encode()
+		fingerprints[name] = hashlib.sha256(blob).hexdigest()
+
+	return fingerprints
+
+
+def _filename(config):
+	return os.path.join(workspace.build,
+			    'fingerprint',
+			    f'{config["name"]}.json')
+
+
+def load(config):
+	"""
+	Returns the fingerprints that were saved after the last successful build
+	of the config, or an empty dictionary if there are none.
+	"""
+	try:
+		with open(_filename(config)) as file:
+			return json.load(file)
+	except (OSError, ValueError):
+		return {}
+
+
+def save(config):
+	"""
+	Computes the fingerprints for all the config's components and saves them
+	so that they can be compared against at the next build. Should only be
+	called once the config has been successfully built.
+	"""
+	filename = _filename(config)
+	os.makedirs(os.path.dirname(filename), exist_ok=True)
+	with open(filename, 'w') as file:
+		json.dump(components(config), file, indent=4, sort_keys=True)
+
+
+def uptodate(config):
+	"""
+	Returns the set of component names whose fingerprint matches the one
+	saved after the last successful build of the config. These components
+	do not need to be rebuilt.
+	"""
+	prev = load(config)
+	curr = components(config)
+	return {k for k, v in curr.items() if prev.get(k) == v}
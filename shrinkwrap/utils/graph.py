@@ -1,13 +1,23 @@
 # Copyright (c) 2022, Arm Limited.
 # SPDX-License-Identifier: MIT
 
+import asyncio
+import collections
 import graphlib
+import heapq
+import itertools
+import json
 import os
+import re
 import shutil
+import sys
 import tempfile
+import time
+import shrinkwrap.utils.config as config
 import shrinkwrap.utils.logger as logger
 import shrinkwrap.utils.label as label
 import shrinkwrap.utils.process as process
+import shrinkwrap.utils.trace as trace
 import shrinkwrap.utils.workspace as workspace
 
 
@@ -90,52 +100,344 @@ def _update_labels(labels, mask, config, component, summary):
 				l1.update(_mk_tag(cfg, cmp) + ' ' + summary)
 
 
-def _run_script(pm, data, script):
+def _durations_filename():
+	return os.path.join(workspace.build, 'durations.json')
+
+
+def _load_durations():
+	"""
+	Returns the dictionary of fragment durations (in seconds) recorded by
+	previous executions, keyed by str(frag).
+	"""
+	try:
+		with open(_durations_filename()) as file:
+			return json.load(file)
+	except (OSError, ValueError):
+		return {}
+
+
+def _save_durations(durations):
+	with open(_durations_filename(), 'w') as file:
+		json.dump(durations, file, indent=4, sort_keys=True)
+
+
+def _mk_priorities(graph, durations):
+	"""
+	Returns a dictionary mapping each fragment to its priority; the
+	estimated time of the longest path from the start of the fragment to
+	the end of the graph. Estimates come from the recorded durations. A
+	fragment without a recorded duration is assumed to take the average of
+	the recorded durations of fragments with the same summary, or 1 second
+	if there are none.
+	"""
+	by_summary = {}
+	for frag in graph:
+		d = durations.get(str(frag))
+		if d is not None:
+			by_summary.setdefault(frag.summary, []).append(d)
+
+	def _estimate(frag):
+		d = durations.get(str(frag))
+		if d is None:
+			known = by_summary.get(frag.summary)
+			d = sum(known) / len(known) if known else 1.0
+		return d
+
+	dependents = {frag: [] for frag in graph}
+	for frag, deps in graph.items():
+		for dep in deps:
+			dependents[dep].append(frag)
+
+	priorities = {}
+	order = list(graphlib.TopologicalSorter(graph).static_order())
+	for frag in reversed(order):
+		tail = max([priorities[d] for d in dependents[frag]], default=0)
+		priorities[frag] = _estimate(frag) + tail
+
+	return priorities
+
+
+def _mk_stats(frag, wall, rusage):
+	"""
+	Returns a dictionary describing the resources used by a fragment.
+	rusage is the dictionary written by _rusage_wrapper, or None if it
+	wasn't written. The CPU times, peak RSS and I/O cover the fragment's
+	script and all the descendants that it waited for. Peak RSS is that of
+	the largest single process, in bytes. I/O is the data actually read from
+	and written to storage (excluding the page cache), in bytes.
+	"""
+	stats = {
+		'config': frag.config,
+		'component': frag.component,
+		'summary': frag.summary,
+		'wall': round(wall, 3),
+		'user': None,
+		'sys': None,
+		'maxrss': None,
+		'read': None,
+		'write': None,
+	}
+
+	if rusage:
+		stats['user'] = round(rusage['user'], 3)
+		stats['sys'] = round(rusage['sys'], 3)
+		stats['maxrss'] = rusage['maxrss']
+		stats['read'] = rusage['read']
+		stats['write'] = rusage['write']
+
+	return stats
+
+
+# Runs a command (argv[2:]) and writes its resource usage as JSON to argv[1],
+# then exits with the command's exit status. Fragments run under this, in the
+# runtime, so that the usage is that of the commands in the container rather
+# than that of the docker/podman exec client on the host. It must work with
+# whatever python3 the runtime's image provides.
+_rusage_wrapper = """\
+import json, os, signal, sys
+pid = os.fork()
+if pid == 0:
+	try:
+		os.execvp(sys.argv[2], sys.argv[2:])
+	finally:
+		os._exit(127)
+for sig in [signal.SIGINT, signal.SIGTERM, signal.SIGHUP]:
+	signal.signal(sig, lambda sig, frame: os.kill(pid, sig))
+_, status, ru = os.wait4(pid, 0)
+# ru_maxrss is in bytes on macos, but KiB elsewhere.
+scale = 1 if sys.platform.startswith('darwin') else 1024
+with open(sys.argv[1], 'w') as file:
+	json.dump({'user': ru.ru_utime,
+		   'sys': ru.ru_stime,
+		   'maxrss': ru.ru_maxrss * scale,
+		   'read': ru.ru_inblock * 512,
+		   'write': ru.ru_oublock * 512}, file)
+if os.WIFSIGNALED(status):
+	sys.exit(128 + os.WTERMSIG(status))
+sys.exit(os.WEXITSTATUS(status))
+"""
+
+
+def _load_rusage(tmpdir):
+	"""
+	Returns the resource usage that _rusage_wrapper wrote for the fragment
+	run in tmpdir, or None if there isn't any (e.g. because the runtime has
+	no python3).
+	"""
+	try:
+		with open(os.path.join(tmpdir, 'rusage.json')) as file:
+			return json.load(file)
+	except (OSError, ValueError):
+		return None
+
+
+def _mk_jobserver(jobs):
+	"""
+	Creates a GNU make jobserver; a fifo in a temp directory, pre-loaded
+	with a token for each job beyond the one that every make gets for free.
+	Returns a tuple of the fd that keeps the fifo open, the temp directory,
+	which the caller must destroy, and the prologue that scripts must run to
+	join the jobserver. The prologue exports the jobserver to make via
+	MAKEFLAGS, and wraps make to drop any explicit -j option, which would
+	otherwise cause make to start its own private jobserver. Neither the
+	prologue nor the wrapper shows up when the script is traced.
+	"""
+	tmpdir = tempfile.mkdtemp(dir=workspace.build)
+	fifo = os.path.join(tmpdir, 'jobserver')
+	os.mkfifo(fifo)
+	fd = os.open(fifo, os.O_RDWR)
+	os.write(fd, b'+' * (jobs - 1))
+
+	prologue = config.Script(None)
+	prologue.append(f'# Join the shared make jobserver. Tracing (if enabled) is')
+	prologue.append(f'# suspended so the output only shows the build commands.')
+	prologue.append(f'{{ _xtrace=$-; set +x; }} 2> /dev/null')
+	prologue.append(f'exec 3<> {fifo}')
+	prologue.append(f'export MAKEFLAGS="-j{jobs} --jobserver-auth=3,3"')
+	prologue.append(f'make() {{')
+	prologue.append(f'\t{{ local xtrace=$-; set +x; }} 2> /dev/null')
+	prologue.append(f'\tlocal args=()')
+	prologue.append(f'\twhile [ $# -gt 0 ]; do')
+	prologue.append(f'\t\tcase "$1" in')
+	prologue.append(f'\t\t-j|--jobs)')
+	prologue.append(f'\t\t\tif [[ "$2" =~ ^[0-9]+$ ]]; then shift; fi;;')
+	prologue.append(f'\t\t-j*|--jobs=*)')
+	prologue.append(f'\t\t\t;;')
+	prologue.append(f'\t\t*)')
+	prologue.append(f'\t\t\targs+=("$1");;')
+	prologue.append(f'\t\tesac')
+	prologue.append(f'\t\tshift')
+	prologue.append(f'\tdone')
+	prologue.append(f'\tif [[ $xtrace == *x* ]]; then set -x; fi')
+	prologue.append(f'\tcommand make "${{args[@]}}"')
+	prologue.append(f'}}')
+	prologue.append(f'if [[ $_xtrace == *x* ]]; then set -x; fi')
+	prologue.append()
+
+	return fd, tmpdir, prologue.commands(False)
+
+
+class _Tail:
+	"""
+	Keeps the end of a stream of text, at least size characters of it
+	(unless the stream is shorter), in bounded memory.
+	"""
+	def __init__(self, size):
+		self._size = size
+		self._len = 0
+		self._chunks = collections.deque()
+		self.truncated = False
+
+	def write(self, data):
+		self._chunks.append(data)
+		self._len += len(data)
+		while self._len - len(self._chunks[0]) >= self._size:
+			self._len -= len(self._chunks.popleft())
+			self.truncated = True
+
+	def lines(self, count):
+		"""
+		Returns a tuple of the last count lines of the kept text (joined)
+		and whether that is less than the whole stream.
+		"""
+		lines = ''.join(self._chunks).splitlines(keepends=True)
+		truncated = self.truncated or len(lines) > count
+		return ''.join(lines[-count:]), truncated
+
+
+# Amount of output kept in memory for each running fragment, to report if it
+# fails. The full output is streamed to a log file.
+_tail_size = 256 * 1024
+_tail_lines = 500
+
+
+def _log_filename(frag):
+	name = re.sub(r'[^A-Za-z0-9._-]+', '_', str(frag))
+	return os.path.join(workspace.build, 'log', f'{name}.log')
+
+
+def _run_script(pm, data, script, prologue=''):
 	# Write the script out to a file in a temp directory, and wrap the
 	# directory name and command to run in a Process. Add the Process to the
 	# ProcessManager. On completion, the caller must destroy the directory.
+	# The prologue is inserted between the preamble and the commands. The
+	# script runs under _rusage_wrapper if the runtime has python3.
 
 	tmpdir = tempfile.mkdtemp(dir=workspace.build)
 	tmpfilename = os.path.join(tmpdir, 'script.sh')
 	with open(tmpfilename, 'w') as tmpfile:
-		tmpfile.write(script.commands())
+		tmpfile.write(script.preamble() + '\n')
+		tmpfile.write(prologue)
+		tmpfile.write(script.commands(False))
+
+	wrapper = os.path.join(tmpdir, 'rusage.py')
+	with open(wrapper, 'w') as wrapperfile:
+		wrapperfile.write(_rusage_wrapper)
+
+	rusage = os.path.join(tmpdir, 'rusage.json')
+	cmd = f'bash {tmpfilename}'
+	launch = f'if command -v python3 > /dev/null; then ' \
+		 f'exec python3 {wrapper} {rusage} {cmd}; fi; exec {cmd}'
 
 	# Start the process asynchronously.
-	pm.add(process.Process(f'bash {tmpfilename}',
+	pm.add(process.Process(f'bash -c "{launch}"',
 			       False,
 			       (*data, script, tmpdir),
 			       True))
 
 
-def execute(graph, tasks, verbose=False, colorize=True):
+def execute(graph,
+	    tasks,
+	    verbose=False,
+	    colorize=True,
+	    uptodate=set(),
+	    jobserver=None,
+	    tracefile=None):
+	"""
+	Executes all the script fragments in the graph, running up to tasks of
+	them in parallel. Fragments whose (config, component) pair is in
+	uptodate are not scheduled; they are marked as up to date and their
+	dependents are released immediately. When more fragments are ready than
+	there are free tasks, those on the longest remaining path through the
+	graph are started first, based on the durations recorded by previous
+	executions. If jobserver is not None, all fragments share a GNU make
+	jobserver with that many jobs. Each running make also has the one job
+	that it can always run, so up to jobserver - 1 + tasks make jobs run
+	in total. The output of each fragment is streamed to its own log file
+	under <SHRINKWRAP_BUILD>/log. Only the last lines are kept in memory,
+	to be reported if the fragment fails. If tracefile is not None, a
+	timeline of the execution is saved to it in Chrome trace event format.
+	Returns a list with the resource usage of each executed fragment, as
+	returned by _mk_stats(), in order of completion.
+	"""
 	labels, mask = _mk_labels(graph)
 	lc = _mk_label_controller(labels, not verbose)
 
+	durations = _load_durations()
+	priorities = _mk_priorities(graph, durations)
+	started = {}
+	stats = []
+	seq = itertools.count()
+
 	queue = []
 	active = 0
+	redrawing = False
 	log = logger.Logger(27, colorize)
 	ts = graphlib.TopologicalSorter(graph)
 
+	prologue = ''
+	if jobserver:
+		js_fd, js_dir, prologue = _mk_jobserver(jobserver)
+
+	tr = trace.Trace() if tracefile else None
+
+	def _enqueue(frags):
+		# The queue is a heap ordered by descending priority. The
+		# sequence number breaks ties, since fragments can't be
+		# compared.
+		for frag in frags:
+			heapq.heappush(queue, (-priorities[frag], next(seq), frag))
+			if tr:
+				tr.ready(frag)
+
 	def _pump(pm):
 		nonlocal queue
 		nonlocal active
 		nonlocal log
 		while len(queue) > 0 and active < tasks:
-			frag = queue.pop()
+			frag = heapq.heappop(queue)[2]
+			if (frag.config, frag.component) in uptodate:
+				_update_labels(labels,
+					       mask,
+					       frag.config,
+					       frag.component,
+					       'Up to date')
+				mask[frag.config][frag.component] = False
+				ts.done(frag)
+				_enqueue(ts.get_ready())
+				continue
 			_update_labels(labels,
 				       mask,
 				       frag.config,
 				       frag.component,
 				       frag.summary + '...')
-			data = (log.alloc_data(str(frag)), [])
-			_run_script(pm, data, frag)
+			logname = _log_filename(frag)
+			os.makedirs(os.path.dirname(logname), exist_ok=True)
+			data = (log.alloc_data(str(frag)),
+				open(logname, 'w'),
+				_Tail(_tail_size))
+			started[frag] = time.monotonic()
+			if tr:
+				tr.start(frag)
+			_run_script(pm, data, frag, prologue)
 			active += 1
 
 	def _log(pm, proc, data, streamid):
+		proc.data[1].write(data)
 		if verbose:
 			log.log(pm, proc, data, streamid)
 		else:
-			proc.data[1].append(data)
+			proc.data[2].write(data)
 			if streamid == process.STDERR:
 				log.log(pm, proc, data, streamid)
 				lc.skip_overdraw_once()
@@ -145,12 +447,18 @@ def execute(graph, tasks, verbose=False, colorize=True):
 		nonlocal active
 		nonlocal ts
 
-		data = proc.data[1]
-		frag = proc.data[2]
-		tmpdir = proc.data[3]
+		logfile = proc.data[1]
+		tail = proc.data[2]
+		frag = proc.data[3]
+		tmpdir = proc.data[4]
 
+		logfile.close()
+		rusage = _load_rusage(tmpdir)
 		shutil.rmtree(tmpdir)
 
+		if tr:
+			tr.finish(frag, retcode)
+
 		if retcode is None:
 			# Forcibly terminated due to errors elsewhere. No need
 			# to do anything further.
@@ -158,8 +466,11 @@ def execute(graph, tasks, verbose=False, colorize=True):
 
 		if retcode:
 			if not verbose:
+				text, truncated = tail.lines(_tail_lines)
 				print('\n== error start ' + ('=' * 65))
-				print(''.join(data))
+				if truncated:
+					print(f'(last {_tail_lines} lines; full output in {logfile.name})')
+				print(text)
 				print('== error end ' + ('=' * 67) + '\n')
 			raise Exception(f"Failed to execute '{frag}'")
 
@@ -172,12 +483,32 @@ def execute(graph, tasks, verbose=False, colorize=True):
 		if frag.final:
 			mask[frag.config][frag.component] = False
 
+		durations[str(frag)] = time.monotonic() - started[frag]
+		stats.append(_mk_stats(frag, durations[str(frag)], rusage))
+
 		ts.done(frag)
 		active -= 1
-		queue.extend(ts.get_ready())
+		_enqueue(ts.get_ready())
 		_pump(pm)
 
-		lc.update()
+		return _redraw()
+
+	def _redraw():
+		# Redraws the labels. If they were redrawn too recently, returns a
+		# coroutine for the process manager to run, which redraws them as
+		# soon as the frame rate allows. Only one is outstanding at once.
+		nonlocal redrawing
+		delay = lc.update()
+		if delay is not None and not redrawing:
+			redrawing = True
+			return _redraw_later(delay)
+
+	async def _redraw_later(delay):
+		nonlocal redrawing
+		while delay is not None:
+			await asyncio.sleep(delay)
+			delay = lc.update()
+		redrawing = False
 
 	# Initially set all labels to waiting. They will be updated as the
 	# fragments execute.
@@ -186,25 +517,36 @@ def execute(graph, tasks, verbose=False, colorize=True):
 	# The process manager will run all added processes in the background and
 	# give callbacks whenever there is output available and when each
 	# process terminates. _pump() adds processes to the set.
-	pm = process.ProcessManager(_log, _complete)
+	pm = process.AsyncProcessManager(_log, _complete)
 
 	# Fill the queue with all the initial script fragments which do not have
 	# start dependencies.
 	ts.prepare()
-	queue.extend(ts.get_ready())
+	_enqueue(ts.get_ready())
 
 	# Call _pump() initially to start as many tasks as are allowed.
-	# Then enter the pm.
-	_pump(pm)
-	lc.update()
-	pm.run()
+	# Then enter the pm. Whatever happens, keep the durations of the
+	# fragments that completed, to improve scheduling next time.
+	try:
+		_pump(pm)
+		lc.update()
+		pm.run()
+	finally:
+		_save_durations(durations)
+		if tr:
+			tr.save(tracefile)
+		if jobserver:
+			os.close(js_fd)
+			shutil.rmtree(js_dir)
 
 	# Mark all components as done. This should be a nop since the script
 	# should have indicated if it was the last step for a given
 	# config/component and we would have already set it to done. But this
 	# catches anything that might have slipped through.
 	_update_labels(labels, mask, None, None, 'Done')
-	lc.update()
+	lc.update(force=True)
+
+	return stats
 
 
 def make_script(graph):
@@ -3,6 +3,7 @@
 
 import os
 import sys
+import time
 
 
 class Label:
@@ -32,14 +33,18 @@ class LabelController:
 	update() can be periodically called to redraw the labels if their
 	contents has changed. Only works as long as no other text is printed to
 	the terminal while the labels are active. If the provided file is not
-	backed by a terminal, overdrawing is not performed.
+	backed by a terminal, overdrawing is not performed. Each redraw is
+	written to the file in one go, only rewrites the labels that changed,
+	and overdrawing happens at most fps times per second.
 	"""
-	def __init__(self, labels=[], file=sys.stdout, overdraw=True):
+	def __init__(self, labels=[], file=sys.stdout, overdraw=True, fps=10):
 		self._labels = labels
 		self._file = file
 		self._overdraw = False
 		self._overdraw_usually = overdraw
 		self._update_pending = True
+		self._interval = 1 / fps
+		self._next_frame = 0
 		try:
 			term_sz = os.get_terminal_size(file.fileno())
 			self._term_lines = term_sz.lines
@@ -49,38 +54,84 @@ class LabelController:
 
 		for label in self._labels:
 			label._lc = self
-
-	def _move_up(self, line_count):
-		assert(self._overdraw)
-		self._file.write('\033[F' * line_count)
+			label._rows = 0
 
 	def _line_count(self, text):
-		assert(self._overdraw)
-		return (len(text) + self._term_cols - 1) // self._term_cols
+		# Writing a newline always moves to the next line, even after an
+		# empty label or one that exactly fills the last line it is on.
+		assert(self._overdraw_usually)
+		return max((len(text) + self._term_cols - 1) // self._term_cols, 1)
+
+	def _move(self, frm, to):
+		if to < frm:
+			return f'\033[{frm - to}F'
+		if to > frm:
+			return f'\033[{to - frm}E'
+		return ''
+
+	def _draw(self, label, out, width):
+		text = label.text.ljust(width)
+		out.append(text + '\n')
+		label._prev_text = label.text
+		return text
+
+	def _overdraw_changed(self, out):
+		# The cursor is on the line below the last label. Work out which
+		# row of the labels each one starts on, and only visit the ones
+		# that changed. A label is padded to fill all the rows it uses,
+		# so that whatever was there is overwritten. If a label now
+		# needs more rows, all the labels below it move down, so have to
+		# be redrawn too. Labels never give up rows.
+		cursor = sum([l._rows for l in self._labels])
+		row = 0
+		reflow = False
+		for l in self._labels:
+			if reflow or l.text != l._prev_text:
+				rows = max(self._line_count(l.text), l._rows)
+				out.append(self._move(cursor, row))
+				self._draw(l, out, rows * self._term_cols)
+				cursor = row + rows
+				if rows > l._rows:
+					l._rows = rows
+					reflow = True
+			row += l._rows
+		out.append(self._move(cursor, row))
 
-	def update(self):
+	def update(self, force=False):
+		"""
+		Redraws the labels if any have changed since the last redraw.
+		When overdrawing, redraws are limited to the frame rate: unless
+		force is True, a redraw that comes too soon after the previous
+		one is held back, and the number of seconds until it can be done
+		is returned. The caller must call update() again after that long
+		for it to be drawn. Otherwise, returns None.
+		"""
 		if not self._update_pending:
-			return
+			return None
+
+		now = time.monotonic()
+		if self._overdraw and not force and now < self._next_frame:
+			return self._next_frame - now
 
+		out = []
 		if self._overdraw:
-			line_count = 0
+			self._overdraw_changed(out)
+		else:
 			for l in self._labels:
-				line_count += self._line_count(l.text)
-			self._move_up(line_count)
-
-		for l in self._labels:
-			if self._overdraw_usually or l.text != l._prev_text:
-				cc = len(l.text)
-				pcc = len(l._prev_text)
-				self._file.write(l.text)
-				self._file.write(' ' * (pcc - cc))
-				self._file.write('\n')
-				l._prev_text = l.text
+				if self._overdraw_usually or l.text != l._prev_text:
+					# Pad to the previous text, so that all
+					# of it is overwritten.
+					text = self._draw(l, out, len(l._prev_text))
+					if self._overdraw_usually:
+						l._rows = self._line_count(text)
 
+		self._file.write(''.join(out))
 		self._file.flush()
 
 		self._overdraw = self._overdraw_usually
 		self._update_pending = False
+		self._next_frame = now + self._interval
+		return None
 
 	def skip_overdraw_once(self):
 		self._overdraw = False
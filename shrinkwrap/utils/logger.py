@@ -8,18 +8,7 @@ termcolor = None
 
 _ansi_escape = re.compile(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])')
 _colors = ['blue', 'cyan', 'green', 'yellow', 'magenta']
-Data = namedtuple("Data", "tag color")
-
-
-def splitlines(string):
-	"""
-	Like str.splitlines(True) but preserves '\r'.
-	"""
-	lines = string.split('\n')
-	keepends = [l + '\n' for l in lines[:-1]]
-	if lines[-1] != '':
-		keepends.append(lines[-1])
-	return keepends
+Data = namedtuple("Data", "tag color prefix")
 
 
 class Logger:
@@ -39,13 +28,20 @@ class Logger:
 		"""
 		Returns the object that should be stashed in proc.data[0] when
 		log() is called. Includes the tag for the process and an
-		allocated colour.
+		allocated colour, along with the prefix that starts each of the
+		process's lines (the tag, truncated or padded to the tag size).
 		"""
 		idx = self._color_next
 		self._color_next += 1
 		self._color_next %= len(_colors)
 		color = _colors[idx]
-		return Data(tag, color)
+
+		prefix = tag
+		if len(prefix) > self._tag_size:
+			prefix = prefix[:self._tag_size-3] + '...'
+		prefix = f'[ {prefix:>{self._tag_size}} ] '
+
+		return Data(tag, color, prefix)
 
 	def log(self, pm, proc, data, streamid):
 		"""
@@ -56,21 +52,24 @@ class Logger:
 		# Remove any ansi escape sequences since we are just outputting
 		# text to stdout. This defends against EDK2's agregious use of
 		# screen clearing. But it does have the side effect that
-		# legitimate shell usage can get a bit wonky.
-		data = _ansi_escape.sub('', data)
+		# legitimate shell usage can get a bit wonky. Most text has none,
+		# so only pay for the regex when there is an escape character.
+		if '\x1b' in data:
+			data = _ansi_escape.sub('', data)
 		if len(data) == 0:
 			return
 
-		tag = proc.data[0].tag
+		prefix = proc.data[0].prefix
 		color = proc.data[0].color
 
-		# Make the tag.
-		if len(tag) > self._tag_size:
-			tag = tag[:self._tag_size-3] + '...'
-		tag = f'{{:>{self._tag_size}}}'.format(tag)
-
-		lines = splitlines(data)
-		start = 0
+		# Ensure that any '\r's only rewind to the end of the tag, and
+		# start every line after a '\n' with the tag, except for the
+		# line that the data leaves unstarted.
+		text = data.replace('\r', '\r' + prefix)
+		if text[-1] == '\n':
+			text = text[:-1].replace('\n', '\n' + prefix) + '\n'
+		else:
+			text = text.replace('\n', '\n' + prefix)
 
 		# If the cursor is not at the start of a new line, then if the
 		# new log is for the same proc that owns the first part of the
@@ -78,31 +77,16 @@ class Logger:
 		# the first part of the line has a different owner, insert a
 		# newline and add a tag for the new owner.
 		if self._prev_char != '\n':
-			if self._prev_tag == tag:
-				self.print(lines[0], tag, True, color, end='')
-				start = 1
-			else:
-				self.print('\n', tag, True, color, end='')
+			if self._prev_tag != prefix:
+				text = '\n' + prefix + text
+		else:
+			text = prefix + text
 
-		for line in lines[start:]:
-			self.print(line, tag, False, color, end='')
+		if self._colorize:
+			text = termcolor.colored(text, color)
 
-		self._prev_tag = tag
-		self._prev_char = lines[-1][-1]
+		self._prev_tag = prefix
+		self._prev_char = data[-1]
 
+		sys.stdout.write(text)
 		sys.stdout.flush()
-
-	def print(self, text, tag, cont, color=None, on_color=None, attrs=None, **kwargs):
-		# Ensure that any '\r's only rewind to the end of the tag.
-		tag = f'[ {tag} ] '
-		text = text.replace('\r', f'\r{tag}')
-
-		if not cont:
-			self._print(tag, color, on_color, attrs, end='')
-
-		self._print(text, color, on_color, attrs, **kwargs)
-
-	def _print(self, text, color=None, on_color=None, attrs=None, **kwargs):
-		if self._colorize:
-			text = termcolor.colored(text, color, on_color, attrs)
-		print(text, **kwargs)
@@ -1,12 +1,18 @@
 # Copyright (c) 2022, Arm Limited.
 # SPDX-License-Identifier: MIT
 
+import asyncio
+import codecs
+import collections
 import fcntl
+import inspect
 import io
+import locale
 import os
 import pty
 import shlex
 import selectors
+import signal
 import subprocess
 import sys
 import shrinkwrap.utils.runtime as runtime
@@ -16,6 +22,11 @@ import shrinkwrap.utils.tty as tty
 STDOUT = 0
 STDERR = 1
 
+# Maximum number of bytes read from a child's stream at a time, and the
+# encoding used to decode them (which is what universal_newlines would use).
+_read_size = 64 * 1024
+_encoding = locale.getpreferredencoding(False)
+
 
 class Process:
 	"""
@@ -26,6 +37,7 @@ class Process:
 		self.interactive = interactive
 		self.data = data
 		self.run_to_end = run_to_end
+		self.rusage = None
 		self._popen = None
 		self._stdout = None
 		self._stdin = None
@@ -45,6 +57,8 @@ class ProcessManager:
 		self._procs = []
 		self._active = 0
 		self._sel = None
+		self._stdin_orig = None
+		self._tty_orig = None
 
 	def set_handler(self, handler):
 		self._handler = handler
@@ -82,6 +96,16 @@ class ProcessManager:
 			self._sel.close()
 			self._sel = None
 
+	def _watch(self, fileobj, data):
+		# Calls data[0](key, mask) whenever fileobj is readable.
+		self._sel.register(fileobj, selectors.EVENT_READ, data)
+
+	def _unwatch(self, fileobj):
+		self._sel.unregister(fileobj)
+
+	def _call(self, handler, *args):
+		handler(*args)
+
 	def _read_nonblock(self, fileobj):
 		# If stdin and stdout are both connected to a tty, setting stdin
 		# to nonblocking will also cause stdout to be set nonblocking
@@ -97,12 +121,46 @@ class ProcessManager:
 	def _proc_handle(self, key, mask):
 		proc = key.data[1]
 		streamid = key.data[2]
-		data = self._read_nonblock(key.fileobj)
+		buf = key.data[3]
+		decoder = key.data[4]
+
+		# Child pipes are non-blocking for their whole life, so they
+		# can be read directly. The pty is shared with the stdin
+		# forwarding writes, so is only made non-blocking for the read.
+		if proc.interactive:
+			fl = fcntl.fcntl(key.fileobj, fcntl.F_GETFL)
+			fcntl.fcntl(key.fileobj, fcntl.F_SETFL, fl | os.O_NONBLOCK)
+		try:
+			count = os.readv(key.fileobj.fileno(), [buf])
+		except BlockingIOError:
+			return
+		except OSError:
+			# The pty reports EIO once the child side is closed.
+			count = 0
+		finally:
+			if proc.interactive:
+				fcntl.fcntl(key.fileobj, fcntl.F_SETFL, fl)
+
+		data = decoder.decode(memoryview(buf)[:count], final=count == 0)
 
-		if data == '':
+		if data and self._handler:
+			self._call(self._handler, self, proc, data, streamid)
+		if count == 0:
 			self._proc_stream_deactivate(proc, key.fileobj, streamid)
-		elif self._handler:
-			self._handler(self, proc, data, streamid)
+
+	def _mk_stream(self, proc, fileobj, streamid, translate):
+		# Each stream gets a reusable read buffer and an incremental
+		# decoder, which copes with multi-byte characters split across
+		# reads. If translate is True, newlines are translated like
+		# universal_newlines does.
+		decoder = codecs.getincrementaldecoder(_encoding)('replace')
+		decoder = io.IncrementalNewlineDecoder(decoder, translate)
+		self._watch(fileobj,
+			    (self._proc_handle,
+			     proc,
+			     streamid,
+			     bytearray(_read_size),
+			     decoder))
 
 	def _proc_activate(self, proc):
 		cmd = runtime.mkcmd(proc.args, proc.interactive)
@@ -116,38 +174,35 @@ class ProcessManager:
 						       stderr=slave)
 
 			proc._stdin = io.open(master, 'wb', buffering=0)
-			proc._stdout = io.open(master, 'rb', -1, closefd=False)
-			# Don't attempt to translate newlines. We need the '\r's
-			# to correctly return the carriage for interactive
-			# terminals. Telnet sometimes gives '\r\r\n' too, which
-			# would be incorrectly translated to '\n\n'.
-			proc._stdout = io.TextIOWrapper(proc._stdout, newline='')
+			proc._stdout = io.open(master, 'rb', buffering=0,
+					       closefd=False)
 			# stdout and stderr get merged into pty, so can't tell
 			# them apart. This isn't a problem for the emit build
 			# warnings use case.
 			proc._stderr = None
 			proc._active = 1
+
+			# Don't attempt to translate newlines. We need the '\r's
+			# to correctly return the carriage for interactive
+			# terminals. Telnet sometimes gives '\r\r\n' too, which
+			# would be incorrectly translated to '\n\n'.
+			self._mk_stream(proc, proc._stdout, STDOUT, False)
 		else:
 			proc._popen = subprocess.Popen(cmd,
 						       stdin=subprocess.DEVNULL,
 						       stdout=subprocess.PIPE,
-						       stderr=subprocess.PIPE,
-						       universal_newlines=True)
+						       stderr=subprocess.PIPE)
 
 			proc._stdin = None
 			proc._stdout = proc._popen.stdout
 			proc._stderr = proc._popen.stderr
 			proc._active = 2
 
-		if proc._stdout:
-			self._sel.register(proc._stdout,
-					   selectors.EVENT_READ,
-					   (self._proc_handle, proc, STDOUT))
+			for stream in [proc._stdout, proc._stderr]:
+				os.set_blocking(stream.fileno(), False)
 
-		if proc._stderr:
-			self._sel.register(proc._stderr,
-					   selectors.EVENT_READ,
-					   (self._proc_handle, proc, STDERR))
+			self._mk_stream(proc, proc._stdout, STDOUT, True)
+			self._mk_stream(proc, proc._stderr, STDERR, True)
 
 		if proc.run_to_end:
 			self._active += 1
@@ -156,7 +211,7 @@ class ProcessManager:
 		if not stream:
 			return
 
-		self._sel.unregister(stream)
+		self._unwatch(stream)
 
 		if streamid == STDOUT:
 			proc._stdout = None
@@ -180,7 +235,20 @@ class ProcessManager:
 		self._proc_stream_deactivate(proc, proc._stdout, STDOUT, force)
 		self._proc_stream_deactivate(proc, proc._stderr, STDERR, force)
 
-		proc._popen.kill()
+		# Reap the process ourselves to get its resource usage (which
+		# includes all the descendants it waited for), killing it first
+		# if it is still running. Popen then sees that it has already
+		# been reaped.
+		try:
+			pid, status, rusage = os.wait4(proc._popen.pid,
+						       os.WNOHANG)
+			if pid == 0:
+				os.kill(proc._popen.pid, signal.SIGKILL)
+				pid, status, rusage = os.wait4(proc._popen.pid, 0)
+			proc.rusage = rusage
+			proc._popen.returncode = os.waitstatus_to_exitcode(status)
+		except ChildProcessError:
+			pass
 		try:
 			proc._popen.communicate()
 		except:
@@ -189,7 +257,7 @@ class ProcessManager:
 		proc._popen = None
 
 		if self._terminate_handler:
-			self._terminate_handler(self, proc, retcode)
+			self._call(self._terminate_handler, self, proc, retcode)
 
 	def _stdin_handle(self, key, mask):
 		data = self._read_nonblock(key.fileobj)
@@ -210,13 +278,11 @@ class ProcessManager:
 		self._tty_orig = tty.configure(sys.stdin)
 
 		# Register stdin so we get notified when there is data.
-		self._sel.register(sys.stdin,
-				   selectors.EVENT_READ,
-				   (self._stdin_handle,))
+		self._watch(sys.stdin, (self._stdin_handle,))
 
 	def _stdin_deactivate(self):
 		# Unregister for notifications.
-		self._sel.unregister(sys.stdin)
+		self._unwatch(sys.stdin)
 
 		# Restore terminal mode.
 		tty.restore(sys.stdin, self._tty_orig)
@@ -225,3 +291,197 @@ class ProcessManager:
 		sys.stdin.close()
 		sys.stdin = self._stdin_orig
 		self._stdin_orig = None
+
+
+class AsyncProcessManager(ProcessManager):
+	"""
+	A ProcessManager that runs on an asyncio event loop instead of its own
+	selector loop. It has the same interface and calls the handlers in the
+	same way, but processes added from within a handler are started from
+	the loop once the handler has returned, rather than re-entering it. If
+	a handler returns an awaitable, it is run as a task on the loop, so the
+	handler can wait for something without holding up the output of the
+	other processes. run() does not return until all such tasks have
+	completed, and an exception raised by a handler or task is raised from
+	run(). If limit is not None, at most that many processes run at once;
+	any others that are added wait for a free slot, in the order they were
+	added. If timeout is not None, a process that runs for longer than that
+	many seconds is killed and its terminate handler is called with the
+	resulting (non-zero) return code.
+	"""
+	def __init__(self,
+		     handler=None,
+		     terminate_handler=None,
+		     limit=None,
+		     timeout=None):
+		super().__init__(handler, terminate_handler)
+		self._limit = limit
+		self._timeout = timeout
+		self._loop = None
+		self._done = None
+		self._pending = collections.deque()
+		self._running = 0
+		self._tasks = set()
+		self._timers = {}
+
+	def add(self, process):
+		self._procs.append(process)
+		if self._loop:
+			self._pending.append(process)
+			self._loop.call_soon(self._guard, self._pump)
+
+	def run(self, forward_stdin=False):
+		asyncio.run(self._run(forward_stdin))
+
+	async def _run(self, forward_stdin):
+		self._loop = asyncio.get_running_loop()
+		self._done = self._loop.create_future()
+		self._active = 0
+		self._running = 0
+		self._pending.extend(self._procs)
+
+		try:
+			if forward_stdin:
+				self._stdin_activate()
+
+			self._pump()
+			await self._done
+		finally:
+			for proc in self._procs:
+				try:
+					self._proc_deactivate(proc, force=True)
+				except:
+					pass
+
+			if forward_stdin:
+				self._stdin_deactivate()
+
+			for task in self._tasks:
+				task.cancel()
+
+			self._pending.clear()
+			self._loop = None
+
+	def _guard(self, fn, *args):
+		# Callbacks from the loop must not raise, since the loop would
+		# only log the exception. Hand it to run() instead.
+		try:
+			fn(*args)
+		except BaseException as e:
+			if not self._done.done():
+				self._done.set_exception(e)
+
+	def _check_done(self):
+		if self._active == 0 and \
+		   not self._tasks and \
+		   not any([p.run_to_end for p in self._pending]) and \
+		   not self._done.done():
+			self._done.set_result(None)
+
+	def _pump(self):
+		while len(self._pending) > 0 and \
+		      (self._limit is None or self._running < self._limit):
+			proc = self._pending.popleft()
+			self._running += 1
+			self._proc_activate(proc)
+			if self._timeout is not None:
+				self._timers[proc] = self._loop.call_later(
+							self._timeout,
+							self._guard,
+							self._proc_timeout,
+							proc)
+		self._check_done()
+
+	def _watch(self, fileobj, data):
+		key = selectors.SelectorKey(fileobj,
+					    fileobj.fileno(),
+					    selectors.EVENT_READ,
+					    data)
+		self._loop.add_reader(key.fd, self._guard, data[0], key, key.events)
+
+	def _unwatch(self, fileobj):
+		self._loop.remove_reader(fileobj.fileno())
+
+	def _call(self, handler, *args):
+		res = handler(*args)
+		if inspect.isawaitable(res):
+			task = asyncio.ensure_future(res)
+			self._tasks.add(task)
+			task.add_done_callback(self._task_done)
+
+	def _task_done(self, task):
+		self._tasks.discard(task)
+		if not task.cancelled():
+			self._guard(self._task_result, task)
+
+	def _task_result(self, task):
+		task.result()
+		self._check_done()
+
+	async def prompt(self, text):
+		"""
+		Prints text and waits for the user to enter a line, which is
+		returned without its line ending, or None at end of file. The loop
+		keeps running, so the processes' output is still handled while
+		waiting. Must be awaited from a handler or task while run() is
+		running. If stdin is being forwarded, forwarding is paused and the
+		terminal is returned to its original mode until the line has been
+		entered.
+		"""
+		fd = sys.stdin.fileno()
+		forwarding = self._stdin_orig is not None
+		if forwarding:
+			self._unwatch(sys.stdin)
+			tty.restore(sys.stdin, self._tty_orig)
+
+		line = bytearray()
+		done = self._loop.create_future()
+
+		def _read():
+			# The terminal is in canonical mode, so this returns
+			# what is available without blocking.
+			data = os.read(fd, _read_size)
+			line.extend(data)
+			if (not data or b'\n' in data) and not done.done():
+				done.set_result(len(line) > 0)
+
+		print(text, end='', flush=True)
+		self._loop.add_reader(fd, _read)
+		try:
+			got_line = await done
+		finally:
+			self._loop.remove_reader(fd)
+			# Don't resume forwarding if run() has already stopped it.
+			if forwarding and self._stdin_orig is not None:
+				tty.configure(sys.stdin)
+				self._watch(sys.stdin, (self._stdin_handle,))
+
+		if not got_line:
+			return None
+		return line.decode(_encoding, 'replace').splitlines()[0]
+
+	def _proc_timeout(self, proc):
+		# Descendants of the process may keep its output streams open
+		# after it is killed, so stop waiting for them to close.
+		del self._timers[proc]
+		for stream, streamid in [(proc._stdout, STDOUT),
+					 (proc._stderr, STDERR)]:
+			self._proc_stream_deactivate(proc, stream, streamid, True)
+			if stream:
+				stream.close()
+		self._proc_deactivate(proc, False)
+
+	def _proc_deactivate(self, proc, force):
+		if not proc._popen:
+			return
+
+		timer = self._timers.pop(proc, None)
+		if timer:
+			timer.cancel()
+		self._running -= 1
+
+		try:
+			super()._proc_deactivate(proc, force)
+		finally:
+			if not force:
+				self._loop.call_soon(self._guard, self._pump)
@@ -4,7 +4,7 @@
 import os
 import subprocess
 import sys
-import tuxmake.runtime
+import threading
 
 
 _stack = []
@@ -16,13 +16,22 @@ class Runtime:
 	an abstracted runtime. Multiple runtimes are supported, identified by a
 	`name`. The 'null' runtime simply executes the commands on the native
 	host. The 'docker', 'docker-local', 'podman' and 'podman-local' runtimes
-	execute the commands in a container.
+	execute the commands in a container. Container runtimes start a single
+	long-lived container in start(), and every command created by mkcmd()
+	is executed inside it (via `docker exec` or `podman exec`), so there is
+	no per-command container startup cost. The container is stopped by
+	cleanup().
 	"""
 	def __init__(self, name, image=None, modal=True):
 		self._modal = modal
 		self._rt = None
 		self._mountpoints = set()
+		self._started = False
+		self._ip = None
+		self._ip_thread = None
 
+		# tuxmake is slow to import, so only do it when it's needed.
+		import tuxmake.runtime
 		self._rt = tuxmake.runtime.Runtime.get(name)
 		self._rt.set_image(image)
 		if not sys.platform.startswith('darwin'):
@@ -43,6 +52,7 @@ class Runtime:
 			self._rt.add_volume(mp)
 
 		self._rt.prepare()
+		self._started = True
 
 	def add_volume(self, src):
 		# Podman can't deal with duplicate mount points, so filter out
@@ -72,13 +82,36 @@ class Runtime:
 		self._mountpoints = mountpoints
 
 	def mkcmd(self, cmd, interactive=False):
+		# Commands can only be wrapped once start() has started the
+		# container that they will be executed in. All volumes must
+		# therefore have been added up front.
+		assert(self._started)
 		return self._rt.get_command_line(cmd, interactive, False)
 
+	def lookup_ip_address(self):
+		"""
+		Starts looking up the primary ip address of the runtime in a
+		background thread, if not already started. The lookup executes a
+		command in the runtime, so it is slow enough to be worth
+		overlapping with other work. Must be called after start().
+		"""
+		if self._ip_thread is None:
+			self._ip_thread = threading.Thread(target=self._lookup_ip,
+							   daemon=True)
+			self._ip_thread.start()
+
+	@property
 	def ip_address(self):
 		"""
-		Returns the primary ip address of the runtime.
+		The primary ip address of the runtime. Looked up on first access
+		(unless lookup_ip_address() already started the lookup) and
+		cached for the lifetime of the Runtime.
 		"""
+		self.lookup_ip_address()
+		self._ip_thread.join()
+		return self._ip
 
+	def _lookup_ip(self):
 		script = """
 import socket
 s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
@@ -99,8 +132,9 @@ print(ip)
 				     stdout=subprocess.PIPE,
 				     stderr=subprocess.PIPE)
 		if res.returncode == 0:
-			return res.stdout.strip()
-		return '127.0.0.1'
+			self._ip = res.stdout.strip()
+		else:
+			self._ip = '127.0.0.1'
 
 	def cleanup(self):
 		if self._rt:
@@ -0,0 +1,95 @@
+# Copyright (c) 2022, Arm Limited.
+# SPDX-License-Identifier: MIT
+
+import heapq
+import json
+import time
+
+
+class Trace:
+	"""
+	Records when each script fragment becomes ready, starts and finishes,
+	and saves the timeline as a Chrome trace event file, which can be viewed
+	with Perfetto (ui.perfetto.dev) or chrome://tracing. Each fragment is a
+	slice on the track of the task slot that executed it, so the tracks show
+	how busy the tasks were. Each slice's args also give the time the
+	fragment spent waiting for a free task and its exit status.
+	"""
+	def __init__(self):
+		self._t0 = time.monotonic()
+		self._ready = {}
+		self._started = {}
+		self._slots = {}
+		self._free = []
+		self._nslots = 0
+		self._events = []
+
+	def _us(self, t):
+		return round((t - self._t0) * 1000000)
+
+	def ready(self, frag):
+		"""
+		Called when all of the fragment's dependencies have completed.
+		"""
+		self._ready[frag] = time.monotonic()
+
+	def start(self, frag):
+		"""
+		Called when the fragment starts executing. It is assigned the
+		lowest numbered free slot.
+		"""
+		if self._free:
+			slot = heapq.heappop(self._free)
+		else:
+			slot = self._nslots
+			self._nslots += 1
+		self._slots[frag] = slot
+		self._started[frag] = time.monotonic()
+
+	def finish(self, frag, retcode):
+		"""
+		Called when the fragment stops executing. retcode is None if it
+		was forcibly terminated.
+		"""
+		now = time.monotonic()
+		slot = self._slots.pop(frag)
+		start = self._started.pop(frag)
+		ready = self._ready.pop(frag, start)
+		heapq.heappush(self._free, slot)
+
+		self._events.append({
+			'name': frag.summary,
+			'cat': 'fragment',
+			'ph': 'X',
+			'pid': 0,
+			'tid': slot,
+			'ts': self._us(start),
+			'dur': self._us(now) - self._us(start),
+			'args': {
+				'config': frag.config,
+				'component': frag.component,
+				'queue_wait_ms': round((start - ready) * 1000, 3),
+				'exit_status': retcode,
+			},
+		})
+
+	def save(self, filename):
+		meta = [{
+			'name': 'process_name',
+			'ph': 'M',
+			'pid': 0,
+			'args': {'name': 'shrinkwrap'},
+		}]
+		meta += [{
+			'name': 'thread_name',
+			'ph': 'M',
+			'pid': 0,
+			'tid': slot,
+			'args': {'name': f'task {slot}'},
+		} for slot in range(self._nslots)]
+
+		with open(filename, 'w') as file:
+			json.dump({
+				'traceEvents': meta + self._events,
+				'displayTimeUnit': 'ms',
+			}, file, indent=1)
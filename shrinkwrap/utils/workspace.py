@@ -7,13 +7,20 @@ _code_root = os.path.dirname(os.path.dirname(__file__))
 _data_root = os.path.expanduser('~/.shrinkwrap')
 
 def _get_loc(var, default):
+	# The locations are created by the commands that write to them, not
+	# here, so that importing the module has no side effects.
 	path = os.environ.get(var, default)
-	path = os.path.abspath(path)
-	os.makedirs(path, exist_ok=True)
-	return path
+	return os.path.abspath(path)
+
+def _get_opt_loc(var):
+	path = os.environ.get(var)
+	return os.path.abspath(path) if path else None
 
 build = _get_loc('SHRINKWRAP_BUILD', os.path.join(_data_root, 'build'))
 package = _get_loc('SHRINKWRAP_PACKAGE', os.path.join(_data_root, 'package'))
+cache = _get_opt_loc('SHRINKWRAP_CACHE')
+gitcache = _get_opt_loc('SHRINKWRAP_GITCACHE')
+cfgcache = _get_opt_loc('SHRINKWRAP_CFGCACHE')
 
 _configs = None
 
@@ -48,6 +55,12 @@ def dump():
 	print(f'  {build}')
 	print(f'workspace.package:')
 	print(f'  {package}')
+	print(f'workspace.cache:')
+	print(f'  {cache}')
+	print(f'workspace.gitcache:')
+	print(f'  {gitcache}')
+	print(f'workspace.cfgcache:')
+	print(f'  {cfgcache}')
 	print(f'workspace.config:')
 	for path in configs():
 		print(f'  {path}')
\ No newline at end of file
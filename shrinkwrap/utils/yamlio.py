@@ -0,0 +1,32 @@
+# Copyright (c) 2022, Arm Limited.
+# SPDX-License-Identifier: MIT
+
+import yaml
+
+# Prefer the libyaml-backed loader, which is much faster than the pure Python
+# one but produces identical results. Fall back to the pure Python one if
+# PyYAML was built without libyaml. Dumping always uses the pure Python
+# dumper; libyaml folds long double-quoted scalars (e.g. those containing
+# non-ASCII characters or escapes) differently, so its output is not
+# byte-identical to yaml.safe_dump().
+try:
+	from yaml import CSafeLoader as _Loader
+except ImportError:
+	from yaml import SafeLoader as _Loader
+from yaml import SafeDumper as _Dumper
+
+
+def load(stream):
+	"""
+	Parses the first YAML document in stream (a string or file object) and
+	returns the corresponding Python object. Equivalent to yaml.safe_load().
+	"""
+	return yaml.load(stream, Loader=_Loader)
+
+
+def dump(data, stream=None, **kwargs):
+	"""
+	Serializes data as a YAML document to stream, or returns it as a string
+	if stream is None. Equivalent to yaml.safe_dump().
+	"""
+	return yaml.dump(data, stream, Dumper=_Dumper, **kwargs)
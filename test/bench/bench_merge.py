@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# Copyright (c) 2022, Arm Limited.
+# SPDX-License-Identifier: MIT
+
+
+# Benchmarks config layer merging. Synthetic layers, each with long build and
+# prerun lists, are written to a temporary directory and loaded in two
+# shapes; many layers in one config and a deep chain of layers. All files are
+# parsed before timing starts, so only merge time is measured.
+
+
+import sys
+import os
+root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path = [p for p in sys.path if os.path.basename(p) != 'shrinkwrap']
+sys.path = [root] + sys.path
+
+
+import argparse
+import tempfile
+import time
+import shrinkwrap.utils.config as config
+
+
+def write_layer(path, index, entries, layers):
+	with open(path, 'w') as f:
+		f.write('%YAML 1.2\n---\n')
+		if layers:
+			f.write('layers:\n')
+			for layer in layers:
+				f.write(f'  - {layer}\n')
+		f.write('build:\n')
+		f.write('  comp:\n')
+		f.write('    params:\n')
+		f.write(f'      P{index}: v{index}\n')
+		f.write('    build:\n')
+		for i in range(entries):
+			f.write(f'      - echo {index} {i}\n')
+		f.write('run:\n')
+		f.write('  prerun:\n')
+		for i in range(entries):
+			f.write(f'    - echo {index} {i}\n')
+
+
+def measure(file_name, repeat):
+	config.layer_files(file_name)
+	best = None
+	for _ in range(repeat):
+		config._merged.clear()
+		start = time.perf_counter()
+		config.load(file_name)
+		elapsed = time.perf_counter() - start
+		best = elapsed if best is None else min(best, elapsed)
+	return best
+
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument('-l', '--layers', type=int, default=60,
+		help="""Number of layers in each shape. Defaults to 60.""")
+	parser.add_argument('-e', '--entries', type=int, default=1000,
+		help="""Number of build and prerun entries in each layer. Defaults
+		     to 1000.""")
+	parser.add_argument('-r', '--repeat', type=int, default=5,
+		help="""Number of times to repeat each measurement. The best time is
+		     reported. Defaults to 5.""")
+	args = parser.parse_args()
+
+	with tempfile.TemporaryDirectory() as tmpdir:
+		# Many layers included directly by one config.
+		names = [f'wide{i}.yaml' for i in range(args.layers)]
+		for i, name in enumerate(names):
+			write_layer(os.path.join(tmpdir, name), i, args.entries, [])
+		wide = os.path.join(tmpdir, 'wide.yaml')
+		write_layer(wide, args.layers, args.entries, names)
+
+		# A chain of layers, each including the previous one.
+		for i in range(args.layers):
+			layers = [f'deep{i - 1}.yaml'] if i else []
+			write_layer(os.path.join(tmpdir, f'deep{i}.yaml'),
+				    i, args.entries, layers)
+		deep = os.path.join(tmpdir, f'deep{args.layers - 1}.yaml')
+
+		wide_time = measure(wide, args.repeat)
+		deep_time = measure(deep, args.repeat)
+
+	print(f'{args.layers} layers in one config: {wide_time * 1000:.0f}ms')
+	print(f'{args.layers}-deep layer chain: {deep_time * 1000:.0f}ms')
+
+
+if __name__ == '__main__':
+	main()
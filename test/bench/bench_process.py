@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# Copyright (c) 2022, Arm Limited.
+# SPDX-License-Identifier: MIT
+
+
+# Benchmarks the throughput of the process managers. A number of writer
+# processes are run on the null runtime, each writing a fixed amount of line
+# oriented output, which the manager reads and passes to a handler that just
+# counts it.
+
+
+import sys
+import os
+root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path = [p for p in sys.path if os.path.basename(p) != 'shrinkwrap']
+sys.path = [root] + sys.path
+
+
+import argparse
+import shlex
+import time
+import shrinkwrap.utils.process as process
+import shrinkwrap.utils.runtime as runtime
+
+
+WRITER = """
+import os, sys
+line = b'x' * 79 + b'\\n'
+size = int(sys.argv[1]) * 1024 * 1024
+if sys.argv[2] == 'block':
+	block = line * 1024
+	for _ in range(size // len(block)):
+		sys.stdout.buffer.write(block)
+else:
+	for _ in range(size // len(line)):
+		os.write(1, line)
+"""
+
+
+def measure(manager, args):
+	total = 0
+
+	def handler(pm, proc, data, streamid):
+		nonlocal total
+		total += len(data)
+
+	cmd = f'{shlex.quote(sys.executable)} -c {shlex.quote(WRITER)} ' \
+	      f'{args.size} {args.mode}'
+	pm = manager(handler, None)
+	for _ in range(args.writers):
+		pm.add(process.Process(cmd, False, None, True))
+
+	wall = time.perf_counter()
+	cpu = time.process_time()
+	pm.run()
+	wall = time.perf_counter() - wall
+	cpu = time.process_time() - cpu
+
+	print(f'{manager.__name__}: {total / 1e6:.0f}MB in {wall:.2f}s wall, '
+	      f'{cpu:.2f}s manager CPU, {total / wall / 1e6:.0f}MB/s')
+
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument('-w', '--writers', type=int, default=4,
+		help="""Number of writer processes. Defaults to 4.""")
+	parser.add_argument('-s', '--size', type=int, default=200,
+		help="""Number of MB written by each writer. Defaults to 200.""")
+	parser.add_argument('-m', '--mode', default='block',
+		choices=['block', 'line'],
+		help="""'block' writes 1024 lines at a time through a buffered
+		     stream. 'line' writes each line with its own os.write().
+		     Defaults to 'block'.""")
+	args = parser.parse_args()
+
+	with runtime.Runtime('null') as rt:
+		rt.start()
+		for manager in [process.ProcessManager,
+				process.AsyncProcessManager]:
+			measure(manager, args)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# Copyright (c) 2022, Arm Limited.
+# SPDX-License-Identifier: MIT
+
+
+# Benchmarks macro tokenization and substitution. Times resolveb() over every
+# standard config, which is dominated by macro substitution, and the
+# tokenizer and substitution on a typical build command.
+
+
+import sys
+import os
+root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path = [p for p in sys.path if os.path.basename(p) != 'shrinkwrap']
+sys.path = [root] + sys.path
+
+
+import argparse
+import copy
+import time
+import shrinkwrap.utils.config as config
+import shrinkwrap.utils.workspace as workspace
+
+
+COMMAND = 'make ${param:jobs} BUILD_BASE=${param:builddir} PLAT=fvp ' \
+	  '${param:join_equal} all fip'
+LUT = {
+	'param': {
+		'jobs': '-j4',
+		'builddir': '/build',
+		'join_equal': 'ARM_ROTPK_LOCATION=devel_rsa',
+	},
+}
+
+
+def measure(fn, repeat):
+	best = None
+	for _ in range(repeat):
+		start = time.perf_counter()
+		fn()
+		elapsed = time.perf_counter() - start
+		best = elapsed if best is None else min(best, elapsed)
+	return best
+
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument('-r', '--repeat', type=int, default=5,
+		help="""Number of times to repeat each measurement. The best time is
+		     reported. Defaults to 5.""")
+	parser.add_argument('-c', '--calls', type=int, default=100000,
+		help="""Number of calls to time for each of the tokenizer and
+		     substitution. Defaults to 100000.""")
+	args = parser.parse_args()
+
+	merged = []
+	for path in workspace.configs():
+		for dir, _, files in os.walk(path):
+			for file in sorted(files):
+				if not file.endswith('.yaml'):
+					continue
+				name = os.path.relpath(os.path.join(dir, file), path)
+				try:
+					c = config.load(config.filename(name), None, name)
+					config.resolveb(copy.deepcopy(c))
+				except Exception:
+					continue
+				merged.append(c)
+
+	def copy_only():
+		for c in merged:
+			copy.deepcopy(c)
+
+	def resolve():
+		for c in merged:
+			config.resolveb(copy.deepcopy(c))
+
+	def tokenize_cold():
+		for _ in range(args.calls):
+			config._string_tokenize.cache_clear()
+			config._string_tokenize(COMMAND)
+
+	def tokenize():
+		for _ in range(args.calls):
+			config._string_tokenize(COMMAND)
+
+	def substitute():
+		for _ in range(args.calls):
+			config._string_substitute(COMMAND, LUT)
+
+	resolve_time = measure(resolve, args.repeat) - \
+		       measure(copy_only, args.repeat)
+	print(f'resolveb() over {len(merged)} configs: '
+	      f'{resolve_time * 1000:.1f}ms per pass')
+	for name, fn in [('tokenize (uncached)', tokenize_cold),
+			 ('tokenize (cached)', tokenize),
+			 ('substitute', substitute)]:
+		us = measure(fn, args.repeat) * 1e6 / args.calls
+		print(f'{name}: {us:.2f}us per call')
+
+
+if __name__ == '__main__':
+	main()
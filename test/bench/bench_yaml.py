@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# Copyright (c) 2022, Arm Limited.
+# SPDX-License-Identifier: MIT
+
+
+# Benchmarks config YAML loading and dumping. Every file in the config store is
+# loaded, and every standard config is dumped once resolved, with both the
+# pure Python PyYAML implementation and the one used by shrinkwrap.utils.yamlio.
+# Before timing, the two are checked to give identical results for the store
+# and for synthetic configs with long, non-ASCII and escaped scalars, which
+# libyaml formats differently.
+
+
+import sys
+import os
+root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path = [p for p in sys.path if os.path.basename(p) != 'shrinkwrap']
+sys.path = [root] + sys.path
+
+
+import argparse
+import random
+import time
+import yaml
+import shrinkwrap.utils.config as config
+import shrinkwrap.utils.workspace as workspace
+import shrinkwrap.utils.yamlio as yamlio
+
+
+def synthetic(count, seed=0):
+	"""
+	Returns count configs with a description and build commands made from
+	random mixes of ASCII, non-ASCII, control characters and quotes, at
+	lengths either side of the line width at which scalars are folded.
+	"""
+	rng = random.Random(seed)
+	alphabet = 'abcdefghij klmnop-=${}:#' + '\t\'"\\' + '\u2014\u00e9\u4e2d' + \
+		   '\x07\x1b' + '\n'
+
+	def scalar():
+		length = rng.choice([10, 60, 79, 80, 81, 120, 300])
+		return ''.join(rng.choice(alphabet) for _ in range(length))
+
+	return [{
+		'description': scalar(),
+		'build': {
+			'comp': {
+				'params': {'-D': scalar()},
+				'build': [scalar() for _ in range(5)],
+			},
+		},
+	} for _ in range(count)]
+
+
+def measure(fn, repeat):
+	best = None
+	for _ in range(repeat):
+		start = time.perf_counter()
+		fn()
+		elapsed = time.perf_counter() - start
+		best = elapsed if best is None else min(best, elapsed)
+	return best
+
+
+def main():
+	parser = argparse.ArgumentParser()
+	parser.add_argument('-r', '--repeat', type=int, default=5,
+		help="""Number of times to repeat each measurement. The best time is
+		     reported. Defaults to 5.""")
+	parser.add_argument('-s', '--synthetic', type=int, default=1000,
+		help="""Number of synthetic configs to check for identical output.
+		     Defaults to 1000.""")
+	args = parser.parse_args()
+
+	texts = []
+	for path in workspace.configs():
+		for dir, _, files in os.walk(path):
+			for file in sorted(files):
+				if file.endswith('.yaml'):
+					with open(os.path.join(dir, file)) as f:
+						texts.append(f.read())
+
+	configs = config.load_resolveb_all([])
+	kwargs = dict(explicit_start=True, sort_keys=False, version=(1, 2))
+
+	def load_py():
+		return [yaml.load(t, Loader=yaml.SafeLoader) for t in texts]
+
+	def load_io():
+		return [yamlio.load(t) for t in texts]
+
+	def dump_py():
+		return [yaml.dump(c, None, Dumper=yaml.SafeDumper, **kwargs)
+			for c in configs]
+
+	def dump_io():
+		return [config.dumps(c) for c in configs]
+
+	if load_py() != load_io() or dump_py() != dump_io():
+		raise Exception('yamlio output differs from pure Python PyYAML')
+
+	for c in synthetic(args.synthetic):
+		text = yaml.safe_dump(c, None, **kwargs)
+		if config.dumps(c) != text:
+			raise Exception(f'yamlio dump differs for {c}')
+		if yamlio.load(text) != yaml.safe_load(text) or \
+		   yamlio.load(text) != c:
+			raise Exception(f'yamlio load differs for {c}')
+
+	print(f'yamlio using {yamlio._Loader.__name__}, {yamlio._Dumper.__name__}')
+	print(f'load {len(texts)} config files: '
+	      f'py {measure(load_py, args.repeat) * 1000:.1f}ms, '
+	      f'yamlio {measure(load_io, args.repeat) * 1000:.1f}ms')
+	print(f'dump {len(configs)} resolved configs: '
+	      f'py {measure(dump_py, args.repeat) * 1000:.1f}ms, '
+	      f'yamlio {measure(dump_io, args.repeat) * 1000:.1f}ms')
+
+
+if __name__ == '__main__':
+	main()